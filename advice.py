@@ -0,0 +1,143 @@
+"""Precomputed treatment advice for each disease label.
+
+The advice for a label never changes between requests, so its HTML
+fragments, JSON body and ETag are built once (per knowledge-base version)
+and a prediction only has to look its label up. The knowledge base is the
+built-in ``disease_solutions`` dict, optionally overlaid field by field
+with a JSON file (``{label: {description, common_symptoms, ...}}``) that
+is re-read only when its modification time changes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from markupsafe import Markup
+
+UNKNOWN_LABEL = 'Unknown Disease'
+
+# The same fallbacks disease_predict() used to apply field by field.
+DEFAULTS = {
+    'description': 'No description available.',
+    'common_symptoms': ['N/A'],
+    'immediate_actions': ['N/A'],
+    'prevention_tips': ['N/A'],
+    'dawai': 'No specific medicine/pesticide advice.',
+    'fertilizer': 'No specific fertilizer advice.',
+    'general_advice': 'No general advice available.',
+    'severity': 'Unknown',
+}
+
+
+def _check_overrides(overrides):
+    if not isinstance(overrides, dict):
+        raise ValueError("expected an object mapping labels to advice")
+    for label, fields in overrides.items():
+        if not isinstance(fields, dict):
+            raise ValueError(f"advice for {label!r} must be an object, not {type(fields).__name__}")
+        for name, value in fields.items():
+            if value is None or isinstance(value, str):
+                continue
+            if isinstance(value, list) and all(isinstance(item, str) for item in value):
+                continue
+            raise ValueError(f"{label}.{name} must be a string or a list of strings")
+
+
+class Advice:
+    """Everything a response needs for one label, built once."""
+
+    def __init__(self, label, solution, macros, version):
+        self.label = label
+        self.solution = {**DEFAULTS, **{k: v for k, v in solution.items() if v}}
+        self.json = json.dumps({'disease': label, 'solution': self.solution}, ensure_ascii=False, sort_keys=True)
+        self.etag = hashlib.sha1(f"{version}:{self.json}".encode('utf-8')).hexdigest()[:20]
+        self.summary_html = Markup(macros.summary(self.solution))
+        self.treatment_html = Markup(macros.treatment(self.solution))
+
+    @property
+    def html(self):
+        return self.summary_html + self.treatment_html
+
+
+class AdviceBook:
+    """Label -> ``Advice``. ``get`` falls back to ``Unknown Disease``.
+
+    ``macros`` is a loaded template module with ``summary(solution)`` and
+    ``treatment(solution)`` macros, e.g.
+    ``app.jinja_env.get_template('_disease_advice.html').module``.
+    """
+
+    def __init__(self, solutions, macros, path=None, check_interval=5.0):
+        self.base = solutions
+        self.macros = macros
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self.reloads = 0
+        self._build(dict(solutions))
+        if path:
+            self._refresh(force=True)
+
+    def _build(self, solutions):
+        solutions.setdefault(UNKNOWN_LABEL, {})
+        version = hashlib.sha1(json.dumps(solutions, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+        entries = {label: Advice(label, solution, self.macros, version) for label, solution in solutions.items()}
+        self._solutions, self._entries, self.version = solutions, entries, version
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if not force and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self._mtime is not None or force:
+                    print(f"Disease knowledge base {self.path} unavailable ({e}); using built-in advice.")
+                    self._mtime = None
+                    self._build(dict(self.base))
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    overrides = json.load(f)
+                _check_overrides(overrides)
+                merged = dict(self.base)
+                for label, fields in overrides.items():
+                    merged[label] = {**self.base.get(label, {}), **fields}
+                self._build(merged)
+            except Exception as e:
+                # Keep serving the last good version until the file changes
+                # again; _build only swaps the entries in once all are built.
+                print(f"Could not load disease knowledge base {self.path}: {e}")
+                self._mtime = mtime
+                return
+            self._mtime = mtime
+            self.reloads += 1
+            print(f"Loaded disease knowledge base {self.path} ({len(overrides)} labels, version {self.version})")
+
+    def get(self, label):
+        if self.path:
+            self._refresh()
+        entries = self._entries
+        return entries.get(label) or entries[UNKNOWN_LABEL]
+
+    def solutions(self):
+        if self.path:
+            self._refresh()
+        return self._solutions
+
+    def stats(self):
+        return {
+            'labels': len(self._entries),
+            'version': self.version,
+            'path': self.path,
+            'reloads': self.reloads,
+        }
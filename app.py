@@ -1,19 +1,31 @@
 import os
-from flask import Flask, render_template, request, jsonify, session
-import joblib
+from flask import Flask, render_template, request, jsonify, session, Response, send_file, stream_with_context, url_for
 import numpy as np
-from PIL import Image
-import google.generativeai as genai
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import pandas as pd
+from PIL import UnidentifiedImageError
 from werkzeug.utils import secure_filename
 import datetime
-import base64
 import io
+import json
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
 
 from dotenv import load_dotenv
-import google.api_core.exceptions
+
+from advice import AdviceBook
+from batching import BatchingPredictor
+from chat_cache import ChatResponseCache, DiseaseKnowledgeBase
+from chat_store import MemoryChatStore, SQLiteChatStore
+from chat_streaming import StreamStats, sse_event, stream_reply
+import disease_tta
+import image_pipeline
+import instrumentation
+from inference_pool import InferencePool, gevent_active
+from job_queue import FINISHED, JobError, JobQueue, QueueFull
+from model_registry import ModelRegistry, disease_model_path, load_joblib, load_keras
+from prediction_cache import PredictionCache, make_key
 
 load_dotenv()
 
@@ -21,20 +33,31 @@ app = Flask(__name__)
 
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'a_super_secret_key_that_you_should_change_in_production')
 
+# --- Metrics ---
+# Request counts, latency, in-flight requests and per-stage timings, served
+# at /metrics. METRICS_LOG=1 also prints one JSON line per request.
+metrics = instrumentation.Metrics()
+instrumentation.init_app(app, metrics, log_requests=os.getenv('METRICS_LOG') == '1')
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# GEMINI_FAKE=1 swaps Gemini for the offline stand-in in fake_llm.py.
+GEMINI_FAKE = os.getenv("GEMINI_FAKE") == '1'
 
-if not GEMINI_API_KEY:
+if not GEMINI_API_KEY and not GEMINI_FAKE:
     raise ValueError("GEMINI_API_KEY environment variable not set. "
                      "Please set it in your .env file or system environment.")
 
-genai.configure(api_key=GEMINI_API_KEY)
 
-try:
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    print("Gemini model initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Gemini model: {e}")
-    model = None
+def load_gemini():
+    if GEMINI_FAKE:
+        from fake_llm import FakeGenerativeModel
+        return FakeGenerativeModel()
+    import google.generativeai as genai
+    # gRPC does not cooperate with gevent; the REST transport goes through
+    # the patched socket module, so a waiting chat only blocks its greenlet.
+    transport = os.getenv('GEMINI_TRANSPORT') or ('rest' if gevent_active() else None)
+    genai.configure(api_key=GEMINI_API_KEY, transport=transport)
+    return genai.GenerativeModel('gemini-1.5-flash')
 
 SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
@@ -43,27 +66,252 @@ SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
 ]
 
-crop_model = None
-disease_model = None
+# --- Model registry ---
+# Models (and tensorflow / joblib / google.generativeai) load on first use.
+# PRELOAD_MODELS=crop,disease,gemini (or "all") loads them at import instead;
+# combined with gunicorn --preload that happens once in the master process
+# and the workers share the memory copy-on-write.
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+
+model_registry = ModelRegistry()
+model_registry.register('crop', load_joblib, os.path.join(MODELS_DIR, 'crop_prediction_model.pkl'))
+
+# With MODEL_SERVER_SOCKET set, the crop and disease models live in one
+# model_server.py process and workers only hold lightweight proxies.
+MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET')
+model_server_client = None
+
+# DISEASE_MODEL_BACKEND=tflite serves a model exported by tflite_backend.py
+# through the standalone TFLite interpreter instead of TensorFlow/Keras.
+DISEASE_MODEL_BACKEND = os.getenv('DISEASE_MODEL_BACKEND', 'keras')
+if MODEL_SERVER_SOCKET:
+    from model_server import ModelServerClient, RemoteCropModel, RemoteDiseaseModel
+    model_server_client = ModelServerClient(MODEL_SERVER_SOCKET, timeout=float(os.getenv('MODEL_SERVER_TIMEOUT', 120)))
+    # Registered under the same model files so cache keys and grid versions still match.
+    model_registry.register('crop', lambda path: RemoteCropModel(model_server_client), os.path.join(MODELS_DIR, 'crop_prediction_model.pkl'))
+    model_registry.register('disease', lambda path: RemoteDiseaseModel(model_server_client),
+                            disease_model_path(MODELS_DIR, DISEASE_MODEL_BACKEND))
+elif DISEASE_MODEL_BACKEND == 'tflite':
+    from tflite_backend import load_tflite
+    model_registry.register('disease', load_tflite, disease_model_path(MODELS_DIR, DISEASE_MODEL_BACKEND))
+else:
+    model_registry.register('disease', load_keras, disease_model_path(MODELS_DIR, DISEASE_MODEL_BACKEND))
+model_registry.register('gemini', load_gemini)
+
+# Pandas-free crop inference, identical to the pipeline (see crop_fastpath.py).
+CROP_FAST_PATH = os.getenv('CROP_FAST_PATH', '1') == '1'
+
+
+def load_crop_fastpath():
+    if MODEL_SERVER_SOCKET:
+        return model_registry.get('crop')  # the server runs the fast path itself
+    from crop_fastpath import FastCropPredictor
+    return FastCropPredictor(model_registry.get('crop'))
+
+
+model_registry.register('crop_fast', load_crop_fastpath)
+
+# Optional precomputed lookup grid (see crop_grid.py). Inputs inside the grid
+# are answered by an O(1) array lookup, everything else goes to the model.
+# Build it offline with `python crop_grid.py build`. CROP_GRID_BUILD=1 builds
+# a missing grid while app.py is imported instead (once, in the gunicorn
+# master with preload_app) -- never inside a request, where it would outlast
+# the worker timeout. CROP_GRID_RAINFALL / _TEMPERATURE / _HUMIDITY set the
+# axes as start:stop:step.
+CROP_GRID_PATH = os.getenv('CROP_GRID_PATH')
+
+
+def build_crop_grid(path):
+    import fcntl
+    import crop_grid
+
+    # Processes importing the app without preload take turns; whoever gets
+    # the lock second finds the file already there.
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            return
+        axes = {}
+        for name, env in zip(crop_grid.NUMERIC_AXES, ('CROP_GRID_RAINFALL', 'CROP_GRID_TEMPERATURE', 'CROP_GRID_HUMIDITY')):
+            if os.getenv(env):
+                axes[name] = crop_grid.parse_axis(os.getenv(env))
+        if MODEL_SERVER_SOCKET:
+            # The registry only holds a proxy here, and with MODEL_SERVER_SPAWN
+            # the server is not even running yet; the grid needs the pipeline.
+            pipeline = load_joblib(os.path.join(MODELS_DIR, 'crop_prediction_model.pkl'))
+        else:
+            pipeline = model_registry.get('crop')
+            if pipeline is None:
+                raise RuntimeError("CROP_GRID_BUILD=1 but the crop model could not be loaded.")
+        started = time.perf_counter()
+        print(f"Building crop grid {path}...")
+        crop_grid.save(crop_grid.build(pipeline, axes, model_version=model_registry.version('crop')), path)
+        print(f"Built crop grid in {time.perf_counter() - started:.1f}s")
+
+
+def load_crop_grid(path):
+    import crop_grid
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} does not exist; build it with `python crop_grid.py build` or CROP_GRID_BUILD=1.")
+    grid = crop_grid.CropGrid.load(path)
+    if grid.model_version != model_registry.version('crop'):
+        raise ValueError(f"{path} was built for a different crop model; rebuild it with crop_grid.py.")
+    return grid
+
+
+if CROP_GRID_PATH:
+    if os.getenv('CROP_GRID_BUILD') == '1' and not os.path.exists(CROP_GRID_PATH):
+        build_crop_grid(CROP_GRID_PATH)
+    model_registry.register('crop_grid', load_crop_grid, CROP_GRID_PATH)
+
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '')
+if PRELOAD_MODELS:
+    model_registry.preload(None if PRELOAD_MODELS == 'all' else [n.strip() for n in PRELOAD_MODELS.split(',') if n.strip()])
+
+# --- Inference pool ---
+# CPU-bound model calls run here, at most INFERENCE_THREADS at a time per
+# worker. Under gevent workers they run in native threads so chats keep
+# streaming while a model is busy (see gunicorn.conf.py).
+inference_pool = InferencePool(int(os.getenv('INFERENCE_THREADS', 2)), name='inference')
+
+
+def run_disease_model(batch):
+    return model_registry.get('disease').predict(batch, verbose=0)
 
-try:
-   
-    crop_model_path = os.path.join(os.path.dirname(__file__), 'models', 'crop_prediction_model.pkl')
-    crop_model = joblib.load(crop_model_path)
-    print(f"Crop prediction model loaded successfully from {crop_model_path}")
 
-    disease_model_path = os.path.join(os.path.dirname(__file__), 'models', 'plant_disease_model.h5')
-    disease_model = load_model(disease_model_path)
-    print(f"Disease prediction model loaded successfully from {disease_model_path}")
+# --- Batched disease inference ---
+# Concurrent uploads (gunicorn threads or greenlets) are merged into one forward pass.
+disease_batcher = BatchingPredictor(
+    lambda batch: inference_pool.run(run_disease_model, batch),
+    max_batch_size=int(os.getenv('DISEASE_BATCH_MAX_SIZE', 16)),
+    max_wait_ms=float(os.getenv('DISEASE_BATCH_MAX_WAIT_MS', 5)),
+    name='disease_model',
+)
 
-except Exception as e:
-    print(f"Error loading models: {e}")
-    crop_model = None
-    disease_model = None
+# --- Prediction cache ---
+# Keys include the model file fingerprint, so replacing a file under models/
+# makes every earlier entry unreachable. Set PREDICTION_CACHE_PATH to a
+# SQLite file to share hits between gunicorn workers.
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv('PREDICTION_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('PREDICTION_CACHE_TTL', 3600)),
+    path=os.getenv('PREDICTION_CACHE_PATH') or None,
+)
+
+
+def predict_disease(img_array):
+    key = make_key('disease', model_registry.version('disease'), img_array)
+    cached = prediction_cache.get(key)
+    if cached is not None:
+        return np.asarray(cached, dtype=np.float32)
+    predictions = disease_batcher.predict(img_array)
+    prediction_cache.set(key, predictions.tolist())
+    return predictions
+
+
+def predict_diseases(batch):
+    keys = [make_key('disease', model_registry.version('disease'), row) for row in batch]
+    results = [prediction_cache.get(key) for key in keys]
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if missing:
+        predictions = disease_batcher.predict_many(batch if len(missing) == len(batch) else batch[missing])
+        for i, row in zip(missing, predictions):
+            results[i] = row
+            prediction_cache.set(keys[i], row.tolist())
+    return [np.asarray(row, dtype=np.float32) for row in results]
+
+
+# --- Test-time augmentation ---
+# DISEASE_TTA=1 (or tta=1 on a request) predicts a few flipped/cropped views
+# of each image in one batch and averages them. Such results carry the top-k
+# labels with temperature-scaled confidences (fit DISEASE_TEMPERATURE with
+# disease_tta.py) and fall back to Unknown Disease below
+# DISEASE_MIN_CONFIDENCE percent.
+DISEASE_TTA = os.getenv('DISEASE_TTA', '0') == '1'
+DISEASE_TTA_VIEWS = disease_tta.parse_views(os.getenv('DISEASE_TTA_VIEWS', ','.join(disease_tta.DEFAULT_VIEWS)))
+DISEASE_TEMPERATURE = float(os.getenv('DISEASE_TEMPERATURE', 1.0))
+DISEASE_TOP_K = int(os.getenv('DISEASE_TOP_K', 3))
+DISEASE_MIN_CONFIDENCE = float(os.getenv('DISEASE_MIN_CONFIDENCE', 40))
+
+
+def tta_requested():
+    value = request.values.get('tta')
+    if value is None:
+        return DISEASE_TTA
+    return value.lower() in ('1', 'true', 'on', 'yes')
+
+
+def _tta_key(row):
+    # Per-view outputs are cached, so changing the temperature needs no flush.
+    return make_key(f"disease_tta[{','.join(DISEASE_TTA_VIEWS)}]", model_registry.version('disease'), row)
+
+
+def predict_disease_tta(img_array):
+    key = _tta_key(img_array)
+    view_predictions = prediction_cache.get(key)
+    if view_predictions is None:
+        view_predictions = disease_batcher.predict_many(disease_tta.augment(img_array, DISEASE_TTA_VIEWS))
+        prediction_cache.set(key, view_predictions.tolist())
+    return disease_tta.combine(view_predictions, DISEASE_TEMPERATURE)
+
+
+def predict_diseases_tta(batch):
+    keys = [_tta_key(row) for row in batch]
+    results = [prediction_cache.get(key) for key in keys]
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if missing:
+        views = np.concatenate([disease_tta.augment(batch[i], DISEASE_TTA_VIEWS) for i in missing])
+        predictions = disease_batcher.predict_many(views).reshape(len(missing), len(DISEASE_TTA_VIEWS), -1)
+        for i, rows in zip(missing, predictions):
+            results[i] = rows
+            prediction_cache.set(keys[i], rows.tolist())
+    return [disease_tta.combine(rows, DISEASE_TEMPERATURE) for rows in results]
+
+
+def predict_crop(crop_model, row):
+    grid = model_registry.get('crop_grid') if CROP_GRID_PATH else None
+    if grid:
+        prediction = grid.lookup(row)
+        if prediction is not None:
+            return str(prediction)
+
+    key = make_key('crop', model_registry.version('crop'), json.dumps(row))
+    prediction = prediction_cache.get(key)
+    if prediction is None:
+        fast_model = model_registry.get('crop_fast') if CROP_FAST_PATH else None
+        if fast_model:
+            prediction = str(fast_model.predict_one(row))
+        else:
+            import pandas as pd
+            input_data = pd.DataFrame([row], columns=['Location', 'Soil Type', 'Rainfall (mm)', 'Temperature (°C)', 'Humidity (%)', 'Season'])
+            prediction = str(crop_model.predict(input_data)[0])
+        prediction_cache.set(key, prediction)
+    return prediction
 
 # --- Configure Upload Folder ---
 app.config['UPLOAD_FOLDER'] = 'static/uploads' 
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024 
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 10)) * 1024 * 1024
+
+# The browser already previews the chosen file itself. 'thumbnail' echoes a
+# small server-side copy (a few KB) into the result page, 'none' skips it.
+DISEASE_PREVIEW_MODE = os.getenv('DISEASE_PREVIEW_MODE', 'thumbnail')
+if DISEASE_PREVIEW_MODE not in ('thumbnail', 'none'):
+    print(f"Unknown DISEASE_PREVIEW_MODE '{DISEASE_PREVIEW_MODE}', using 'thumbnail'.")
+    DISEASE_PREVIEW_MODE = 'thumbnail'
+DISEASE_PREVIEW_SIZE = int(os.getenv('DISEASE_PREVIEW_SIZE', image_pipeline.THUMBNAIL_SIZE))
+if DISEASE_PREVIEW_MODE == 'thumbnail':
+    DISEASE_DECODE_SIZE = (max(DISEASE_PREVIEW_SIZE, *image_pipeline.MODEL_INPUT_SIZE),) * 2
+else:
+    DISEASE_DECODE_SIZE = image_pipeline.MODEL_INPUT_SIZE
+DISEASE_BATCH_MAX_IMAGES = int(os.getenv('DISEASE_BATCH_MAX_IMAGES', 64))
+# Total image bytes per batch after unzipping, so a small archive of highly
+# compressible entries cannot expand without bound.
+DISEASE_BATCH_MAX_BYTES = int(os.getenv('DISEASE_BATCH_MAX_MB', 100)) * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# PIL releases the GIL while decoding and resizing, so threads scale here.
+image_decode_pool = InferencePool(int(os.getenv('IMAGE_DECODE_WORKERS', 4)), name='image-decode')
 
 disease_solutions = {
     'Potato___healthy': {
@@ -260,6 +508,104 @@ disease_labels = [
     'Potato___Early_blight'
 ]
 
+# Advice HTML/JSON is rendered once per label (see advice.py). DISEASE_KB_PATH
+# points at an optional JSON file that overrides disease_solutions per label;
+# it is re-read only when its modification time changes.
+advice_book = AdviceBook(disease_solutions, app.jinja_env.get_template('_disease_advice.html').module,
+                         path=os.getenv('DISEASE_KB_PATH') or None,
+                         check_interval=float(os.getenv('DISEASE_KB_CHECK_SECONDS', 5)))
+
+
+def describe_prediction(predictions, tta=False):
+    if tta:
+        result = disease_tta.summarize(predictions, disease_labels, DISEASE_TOP_K, DISEASE_MIN_CONFIDENCE)
+        result['solution'] = advice_book.get(result['disease']).solution
+        return result
+
+    predicted_class_index = int(np.argmax(predictions))
+    if 0 <= predicted_class_index < len(disease_labels):
+        predicted_label = disease_labels[predicted_class_index]
+        confidence_score = float(predictions[predicted_class_index]) * 100
+    else:
+        predicted_label = 'Unknown Disease'
+        confidence_score = None
+
+    return {
+        'disease': predicted_label,
+        'confidence': round(confidence_score, 2) if confidence_score is not None else None,
+        'solution': advice_book.get(predicted_label).solution,
+    }
+
+
+def iter_batch_images(limit, max_bytes):
+    """Yield ``(filename, stream)`` for each uploaded image and image in the
+    uploaded zip. Raises ``ValueError`` past ``limit`` images or
+    ``max_bytes`` of image data, counting archive entries uncompressed."""
+    count, total = 0, 0
+
+    def admit(name, size):
+        nonlocal count, total
+        count += 1
+        total += size
+        if count > limit:
+            raise ValueError(f"At most {limit} images can be analysed per request.")
+        if total > max_bytes:
+            raise ValueError(f"The images add up to more than {max_bytes // (1024 * 1024)} MB.")
+
+    for file in request.files.getlist('images'):
+        if file.filename:
+            file.stream.seek(0, os.SEEK_END)
+            admit(file.filename, file.stream.tell())
+            file.stream.seek(0)
+            yield file.filename, file.stream
+
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        with zipfile.ZipFile(archive.stream) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if info.file_size > app.config['MAX_CONTENT_LENGTH']:
+                    raise ValueError(f"{info.filename} is too large.")
+                # Reads stop at the declared size, so it bounds what we unpack.
+                admit(info.filename, info.file_size)
+                with zf.open(info) as entry:
+                    yield info.filename, entry
+
+
+def collect_batch_images(limit=DISEASE_BATCH_MAX_IMAGES, max_bytes=DISEASE_BATCH_MAX_BYTES):
+    return [(name, stream.read()) for name, stream in iter_batch_images(limit, max_bytes)]
+
+
+def prepare_disease_image(stream, out, timings=None, preview=True):
+    with metrics.stage('decode', timings):
+        img = image_pipeline.open_image(stream, min_size=DISEASE_DECODE_SIZE)
+        img.load()
+    with metrics.stage('resize', timings):
+        img_array = image_pipeline.to_model_input(img, out=out)
+    image_url = None
+    if preview:
+        with metrics.stage('preview', timings):
+            image_url = image_pipeline.thumbnail_data_url(img, DISEASE_PREVIEW_SIZE)
+    return img_array, image_url
+
+
+def wants_json():
+    if request.args.get('format') == 'json':
+        return True
+    best = request.accept_mimetypes.best_match(['text/html', 'application/json'])
+    return best == 'application/json' and request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
+
+
+def _decode_batch_image(job):
+    data, out = job
+    try:
+        image_pipeline.load_into(data, out)
+        return None
+    except Exception as e:
+        return f"Could not read image: {e}"
+
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -277,17 +623,19 @@ def crop_predict():
             temperature = float(request.form.get('temperature'))
             humidity = float(request.form.get('humidity'))
 
-            input_data = pd.DataFrame([[
-                request.form.get('location'),
-                request.form.get('soil_type'),
+            input_row = [
+                request.form.get('location').strip(),
+                request.form.get('soil_type').strip(),
                 rainfall,
                 temperature,
                 humidity,
-                request.form.get('season')
-            ]], columns=['Location', 'Soil Type', 'Rainfall (mm)', 'Temperature (°C)', 'Humidity (%)', 'Season'])
+                request.form.get('season').strip()
+            ]
 
+            crop_model = model_registry.get('crop')
             if crop_model:
-                prediction = crop_model.predict(input_data)[0]
+                with metrics.stage('crop_predict'):
+                    prediction = inference_pool.run(predict_crop, crop_model, input_row)
                 prediction_result = f"The best crop to grow is: {prediction}"
             else:
                 prediction_result = "Crop prediction service is currently unavailable. Model not loaded."
@@ -298,22 +646,61 @@ def crop_predict():
             prediction_result = "An error occurred during prediction"
             print(f"Crop prediction error: {e}")
 
-    return render_template('crop_predict.html', prediction_result=prediction_result)
+    with metrics.stage('render'):
+        return render_template('crop_predict.html', prediction_result=prediction_result)
+
+
+@app.route('/crop-predict/bulk', methods=['POST'])
+def crop_predict_bulk():
+    data_file = request.files.get('dataFile')
+    if not data_file or not data_file.filename:
+        return jsonify({"error": "Upload a CSV or XLSX file as 'dataFile'."}), 400
+
+    crop_model = model_registry.get('crop')
+    if not crop_model:
+        return jsonify({"error": "Crop prediction service is currently unavailable. Model not loaded."}), 503
+
+    import crop_bulk
+
+    # The upload is copied to a file owned by the response so it stays
+    # readable while the result is streamed after the handler returns.
+    upload = tempfile.TemporaryFile()
+    data_file.save(upload)
+    upload.seek(0)
+    try:
+        top_k = int(request.form.get('top_k', 3))
+        rows = crop_bulk.stream_predictions(crop_model, upload, data_file.filename,
+                                            chunk_size=int(os.getenv('CROP_BULK_CHUNK_SIZE', crop_bulk.DEFAULT_CHUNK_SIZE)),
+                                            top_k=top_k, run=inference_pool.run)
+    except Exception as e:
+        upload.close()
+        if isinstance(e, (ValueError, KeyError)):
+            return jsonify({"error": f"Invalid input: {e}"}), 400
+        print(f"Bulk crop prediction error: {e}")
+        return jsonify({"error": "An error occurred during prediction"}), 500
+
+    def generate():
+        try:
+            yield from rows
+        finally:
+            upload.close()
+
+    download_name = os.path.splitext(secure_filename(data_file.filename))[0] or 'crops'
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={download_name}_recommendations.csv'})
 
 
 @app.route('/disease-predict', methods=['GET', 'POST'])
 def disease_predict():
+    as_json = wants_json()
+    tta = tta_requested()
+    image_uploaded = False
+    status_code = 200
     image_url = None
     disease_identified = None
     confidence = None
-    description = None
-    common_symptoms = []
-    immediate_actions = []
-    prevention_tips = []
-    solution_dawai = None
-    solution_fertilizer = None
-    solution_general_advice = None
-    severity = None
+    advice = None
+    result = None
     error_message = None
 
     if request.method == 'POST' and 'imageUpload' in request.files:
@@ -321,128 +708,558 @@ def disease_predict():
         
         if file.filename == '':
             error_message = "Please select an image to upload."
+            status_code = 400
         else:
+            image_uploaded = True
             try:
-                img = Image.open(file.stream).convert('RGB')
+                img_array, image_url = image_decode_pool.run(prepare_disease_image, file.stream, image_pipeline.input_buffer(),
+                                                             instrumentation.current_timings(),
+                                                             DISEASE_PREVIEW_MODE == 'thumbnail' and not as_json)
                 
-                buffered = io.BytesIO()
-                img.save(buffered, format="JPEG")
-                image_url = "data:image/jpeg;base64," + base64.b64encode(buffered.getvalue()).decode()
-                
-                if disease_model:
-              
-                    img_resized = img.resize((128, 128)) 
-                    img_array = np.asarray(img_resized)
-                    img_array = np.expand_dims(img_array, axis=0)
-                    img_array = img_array / 255.0
-
-                    predictions = disease_model.predict(img_array)
-                    predicted_class_index = np.argmax(predictions, axis=1)[0]
-                    
-                    if 0 <= predicted_class_index < len(disease_labels):
-                        predicted_label = disease_labels[predicted_class_index]
-                        confidence_score = predictions[0][predicted_class_index] * 100
-
-                        disease_identified = predicted_label
-                        confidence = f"{confidence_score:.2f}%"
-
-                        solution_data = disease_solutions.get(predicted_label, disease_solutions['Unknown Disease'])
-                        description = solution_data.get('description', 'No description available.')
-                        common_symptoms = solution_data.get('common_symptoms', ['N/A'])
-                        immediate_actions = solution_data.get('immediate_actions', ['N/A'])
-                        prevention_tips = solution_data.get('prevention_tips', ['N/A'])
-                        solution_dawai = solution_data.get('dawai', 'No specific medicine/pesticide advice.')
-                        solution_fertilizer = solution_data.get('fertilizer', 'No specific fertilizer advice.')
-                        solution_general_advice = solution_data.get('general_advice', 'No general advice available.')
-                        severity = solution_data.get('severity', 'Unknown')
-                    else:
+                if model_registry.get('disease'):
+                    with metrics.stage('disease_predict'):
+                        predictions = predict_disease_tta(img_array) if tta else predict_disease(img_array)
+                    result = describe_prediction(predictions, tta)
+                    disease_identified = result['disease']
+                    advice = advice_book.get(disease_identified)
+                    if result['confidence'] is None:
                         error_message = "Predicted class index out of bounds. Model output might be unexpected."
-                        solution_data = disease_solutions['Unknown Disease']
-                        description = solution_data.get('description')
-                        common_symptoms = solution_data.get('common_symptoms')
-                        immediate_actions = solution_data.get('immediate_actions')
-                        prevention_tips = solution_data.get('prevention_tips')
-                        solution_dawai = solution_data.get('dawai')
-                        solution_fertilizer = solution_data.get('fertilizer')
-                        solution_general_advice = solution_data.get('general_advice')
-                        severity = solution_data.get('severity')
-                        disease_identified = "Unknown Disease" 
-
+                    elif not result.get('uncertain'):
+                        confidence = f"{result['confidence']:.2f}%"
 
                 else:
                     error_message = "Disease prediction model not loaded."
+                    status_code = 503
 
             except Exception as e:
                 error_message = f"Error processing image or predicting disease: {e}"
+                status_code = 400 if isinstance(e, UnidentifiedImageError) else 500
                 print(f"Disease prediction error: {e}")
 
-    return render_template('disease_detect.html', 
-                           image_url=image_url,
-                           disease_identified=disease_identified,
-                           confidence=confidence,
-                           description=description,
-                           common_symptoms=common_symptoms,
-                           immediate_actions=immediate_actions,
-                           prevention_tips=prevention_tips,
-                           solution_dawai=solution_dawai,
-                           solution_fertilizer=solution_fertilizer,
-                           solution_general_advice=solution_general_advice,
-                           severity=severity,
-                           error_message=error_message)
+    if as_json:
+        if result is not None:
+            return jsonify(result)
+        if error_message:
+            return jsonify({"error": error_message}), status_code
+        return jsonify({"error": "POST an image as 'imageUpload'."}), 400
+
+    with metrics.stage('render'):
+        return render_template('disease_detect.html',
+                               image_url=image_url,
+                               image_uploaded=image_uploaded,
+                               disease_identified=disease_identified,
+                               confidence=confidence,
+                               advice=advice,
+                               tta=tta,
+                               top_k=result.get('top_k') if result else None,
+                               uncertain=bool(result and result.get('uncertain')),
+                               error_message=error_message)
+
+@app.route('/disease-predict/batch', methods=['POST'])
+def disease_predict_batch():
+    if not model_registry.get('disease'):
+        return jsonify({"error": "Disease prediction model not loaded."}), 503
+
+    try:
+        images = collect_batch_images()
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"error": f"Invalid upload: {e}"}), 400
+
+    if not images:
+        return jsonify({"error": "Upload one or more files as 'images' or a zip file as 'archive'."}), 400
+
+    try:
+        results = diagnose_images(images, tta_requested())
+    except Exception as e:
+        print(f"Batch disease prediction error: {e}")
+        return jsonify({"error": f"Error predicting disease: {e}"}), 500
+    return jsonify({"count": len(results), "results": results})
+
+
+def diagnose_images(images, tta=False):
+    """Decode and diagnose ``[(filename, bytes)]`` in one forward pass."""
+    width, height = image_pipeline.MODEL_INPUT_SIZE
+    batch = np.empty((len(images), height, width, 3), dtype=np.float32)
+    with metrics.stage('batch_decode'):
+        errors = list(image_decode_pool.map(_decode_batch_image, [(data, batch[i]) for i, (_, data) in enumerate(images)]))
+    valid = [i for i, error in enumerate(errors) if error is None]
+
+    results = [{'filename': name} for name, _ in images]
+    for i, error in enumerate(errors):
+        if error:
+            results[i]['error'] = error
+
+    if valid:
+        with metrics.stage('disease_predict'):
+            predict = predict_diseases_tta if tta else predict_diseases
+            predictions = predict(batch if len(valid) == len(images) else batch[valid])
+        for i, row in zip(valid, predictions):
+            results[i].update(describe_prediction(row, tta))
+    return results
+
+@app.route('/disease-advice/<label>')
+def disease_advice(label):
+    advice = advice_book.get(label)
+    if request.args.get('format') == 'html':
+        response = Response(advice.html, mimetype='text/html')
+        response.set_etag(f"{advice.etag}-html")
+    else:
+        response = Response(advice.json, mimetype='application/json')
+        response.set_etag(advice.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(os.getenv('DISEASE_ADVICE_MAX_AGE', 3600))
+    return response.make_conditional(request)
+
+
+@app.route('/disease-predict/stats')
+def disease_predict_stats():
+    return jsonify({**disease_batcher.stats(), 'inference_pool': inference_pool.stats(), 'advice': advice_book.stats()})
+
+@app.route('/models/status')
+def models_status():
+    status = model_registry.status()
+    if model_server_client:
+        try:
+            status['model_server'] = model_server_client.call({'op': 'status'})
+        except Exception as e:
+            status['model_server'] = {'error': str(e)}
+    return jsonify(status)
+
+@app.route('/prediction-cache/stats')
+def prediction_cache_stats():
+    return jsonify(prediction_cache.stats())
+
+# --- Chat history ---
+# Conversations live on the server; the session cookie only carries a chat id.
+# CHAT_STORE=sqlite (default) shares them between workers through
+# CHAT_STORE_PATH, CHAT_STORE=memory keeps them per process. Only the newest
+# CHAT_CONTEXT_TOKENS worth of turns are sent to Gemini, older ones are
+# condensed into a summary of at most CHAT_SUMMARY_TOKENS.
+CHAT_STORE = os.getenv('CHAT_STORE', 'sqlite')
+chat_store_options = {
+    'max_tokens': int(os.getenv('CHAT_CONTEXT_TOKENS', 2000)),
+    'summary_tokens': int(os.getenv('CHAT_SUMMARY_TOKENS', 300)),
+    'ttl': float(os.getenv('CHAT_STORE_TTL', 86400)),
+}
+if CHAT_STORE == 'memory':
+    chat_store = MemoryChatStore(**chat_store_options)
+else:
+    chat_store = SQLiteChatStore(os.getenv('CHAT_STORE_PATH') or os.path.join(tempfile.gettempdir(), 'farm_mitra_chats.sqlite3'),
+                                 **chat_store_options)
+
+
+
+def record_chat_stream(outcome, ttft):
+    metrics.inc('chat_streams_total', {'outcome': outcome})
+    if ttft is not None:
+        metrics.observe('stage_seconds', ttft, {'stage': 'llm_first_token'})
+
+
+chat_stream_stats = StreamStats(on_record=record_chat_stream)
+
+# --- Chat answer cache ---
+# Questions asked at the start of a conversation have no context, so the
+# same question (after normalisation) or a close variant of it
+# (CHAT_CACHE_SIMILARITY, 1 = exact only) gets the cached answer instead
+# of a Gemini round-trip. CHAT_KB_ANSWERS=1 answers questions naming one
+# known disease straight from the advice book, following its reloads.
+chat_response_cache = ChatResponseCache(
+    max_entries=int(os.getenv('CHAT_CACHE_SIZE', 512)),
+    ttl=float(os.getenv('CHAT_CACHE_TTL', 86400)),
+    similarity=float(os.getenv('CHAT_CACHE_SIMILARITY', 0.8)),
+)
+chat_knowledge_base = DiseaseKnowledgeBase(disease_labels, advice_book.solutions) if os.getenv('CHAT_KB_ANSWERS', '1') == '1' else None
+
+
+def cached_chat_answer(history, user_message):
+    if history:
+        return None
+    if chat_knowledge_base:
+        answer = chat_knowledge_base.answer(user_message)
+        if answer:
+            chat_response_cache.record_kb_hit()
+            return answer
+    return chat_response_cache.get(user_message)
+
+
+def current_chat_id():
+    # Older cookies carried the whole history; drop it now that it lives here.
+    if 'chat_history' in session:
+        session.pop('chat_history')
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid.uuid4().hex
+    return session['chat_id']
+
 
 @app.route('/chat_ai')
 def chat_ai():
-
-    if 'chat_history' not in session:
-        session['chat_history'] = []
+    current_chat_id()
     return render_template('chat_ai.html')
 
+
+def blocked_response_message(response):
+    print(f"Gemini response did not contain text content. Raw response: {response}")
+    if response is not None and response.prompt_feedback and response.prompt_feedback.block_reason:
+        return "Your message was blocked due to safety concerns. Please try rephrasing."
+    if response is not None and response.candidates and len(response.candidates) > 0 and response.candidates[0].finish_reason == 'SAFETY':
+        return "The AI's response was blocked due to safety filters."
+    return "The AI did not provide a complete response."
+
+
+def chat_error_response(e):
+    try:
+        import google.generativeai as genai
+        import google.api_core.exceptions
+    except ImportError:
+        genai = None
+
+    if genai is not None and isinstance(e, genai.types.BlockedPromptException):
+        print(f"Prompt blocked by safety settings: {e}")
+        return "Your message was blocked by safety filters. Please try rephrasing.", 400
+    if genai is not None and isinstance(e, google.api_core.exceptions.GoogleAPIError):
+        print(f"Gemini API error (GoogleAPIError): {e}")
+        return f"Error communicating with AI: {e}. Please try again later.", 500
+    print(f"An unexpected error occurred in chat route: {e}")
+    return f"Sorry, an internal error occurred: {e}. Please try again later.", 500
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
     user_message = request.json.get('message')
     if not user_message:
         return jsonify({"response": "No message received."}), 400
 
+    payload, status = answer_chat(current_chat_id(), user_message)
+    return jsonify(payload), status
 
-    history = session.get('chat_history', [])
 
-    try:
-        if not model:
-            return jsonify({"response": "AI model not available on server. Please check server logs for initialization errors."}), 503 # Service Unavailable
+def answer_chat(chat_id, user_message):
+    history = chat_store.history(chat_id)
 
+    cached = cached_chat_answer(history, user_message)
+    if cached is not None:
+        chat_store.add_turn(chat_id, user_message, cached)
+        return {"response": cached, "cached": True}, 200
+
+    model = model_registry.get('gemini')
+    if not model:
+        return {"response": "AI model not available on server. Please check server logs for initialization errors."}, 503 # Service Unavailable
+
+    try:
         chat_session = model.start_chat(history=history)
 
-        response = chat_session.send_message(user_message, safety_settings=SAFETY_SETTINGS)
+        with metrics.stage('llm'):
+            response = chat_session.send_message(user_message, safety_settings=SAFETY_SETTINGS)
 
         ai_response_text = ""
         try:
             ai_response_text = response.text
+            if not history:
+                chat_response_cache.set(user_message, ai_response_text)
         except ValueError:
+            ai_response_text = blocked_response_message(response)
 
-            print(f"Gemini response did not contain text content. Raw response: {response}")
-            if response.prompt_feedback and response.prompt_feedback.block_reason:
-                ai_response_text = "Your message was blocked due to safety concerns. Please try rephrasing."
-            elif response.candidates and len(response.candidates) > 0 and response.candidates[0].finish_reason == 'SAFETY':
-                ai_response_text = "The AI's response was blocked due to safety filters."
-            else:
-                ai_response_text = "The AI did not provide a complete response."
 
+        chat_store.add_turn(chat_id, user_message, ai_response_text)
 
-        history.append({'role': 'user', 'parts': [{'text': user_message}]})
-        history.append({'role': 'model', 'parts': [{'text': ai_response_text}]})
-        session['chat_history'] = history 
+        return {"response": ai_response_text}, 200
 
-        return jsonify({"response": ai_response_text})
+    except Exception as e:
+        message, status = chat_error_response(e)
+        return {"response": message}, status
 
-    except genai.types.BlockedPromptException as e:
-        print(f"Prompt blocked by safety settings: {e}")
-        return jsonify({"response": "Your message was blocked by safety filters. Please try rephrasing."}), 400
-    except google.api_core.exceptions.GoogleAPIError as e: 
-        print(f"Gemini API error (GoogleAPIError): {e}")
-        return jsonify({"response": f"Error communicating with AI: {e}. Please try again later."}), 500
-    except Exception as e: 
-        print(f"An unexpected error occurred in chat route: {e}")
-        return jsonify({"response": f"Sorry, an internal error occurred: {e}. Please try again later."}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message')
+    if not user_message:
+        return jsonify({"response": "No message received."}), 400
+
+    chat_id = current_chat_id()
+    history = chat_store.history(chat_id)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    cached = cached_chat_answer(history, user_message)
+    if cached is not None:
+        chat_store.add_turn(chat_id, user_message, cached)
+        events = [sse_event('token', {'text': cached}), sse_event('done', {'response': cached, 'cached': True})]
+        return Response(events, mimetype='text/event-stream', headers=headers)
+
+    model = model_registry.get('gemini')
+    if not model:
+        return jsonify({"response": "AI model not available on server. Please check server logs for initialization errors."}), 503
+
+    chat_session = model.start_chat(history=history)
+
+    def on_complete(ai_response_text, answered):
+        chat_store.add_turn(chat_id, user_message, ai_response_text)
+        if answered and not history:
+            chat_response_cache.set(user_message, ai_response_text)
+
+    def describe_error(e, response):
+        return chat_error_response(e)[0] if e is not None else blocked_response_message(response)
+
+    events = stream_reply(chat_session, user_message, SAFETY_SETTINGS, chat_stream_stats, on_complete, describe_error)
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/chat/stream/stats')
+def chat_stream_stats_view():
+    return jsonify(chat_stream_stats.snapshot())
+
+@app.route('/chat/store/stats')
+def chat_store_stats():
+    return jsonify(chat_store.stats())
+
+@app.route('/chat/cache/stats')
+def chat_cache_stats():
+    return jsonify(chat_response_cache.stats())
+
+
+# --- Background jobs ---
+# Large batch uploads, bulk spreadsheets and chat turns can be submitted to
+# /jobs/... instead: the request returns 202 with a job id straight away and
+# the work runs on JOB_WORKERS threads per process, so nothing holds a web
+# worker past the gunicorn timeout. Identical submissions share one job, and
+# beyond JOB_MAX_PENDING waiting jobs new ones get 429.
+job_queue = JobQueue(
+    os.getenv('JOB_DIR') or os.path.join(tempfile.gettempdir(), 'farm_mitra_jobs'),
+    workers=int(os.getenv('JOB_WORKERS', 2)),
+    max_pending=int(os.getenv('JOB_MAX_PENDING', 100)),
+    ttl=float(os.getenv('JOB_TTL', 86400)),
+    stale_after=float(os.getenv('JOB_STALE_SECONDS', 600)),
+)
+JOB_MAX_IMAGES = int(os.getenv('JOB_MAX_IMAGES', 2000))
+JOB_MAX_IMAGE_BYTES = int(os.getenv('JOB_MAX_IMAGE_MB', 1024)) * 1024 * 1024
+JOB_EVENTS_INTERVAL = float(os.getenv('JOB_EVENTS_INTERVAL', 0.5))
+# An open /jobs/<id>/events stream costs a greenlet under gevent but one of
+# the worker's few threads under gthread/sync, so there it ends after this
+# many seconds and EventSource reconnects for the next window.
+JOB_EVENTS_MAX_SECONDS = float(os.getenv('JOB_EVENTS_MAX_SECONDS', 30))
+
+
+def write_batch_images(f):
+    """Stream the request's images into ``f`` as an uncompressed zip."""
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as zf:
+        for i, (name, stream) in enumerate(iter_batch_images(JOB_MAX_IMAGES, JOB_MAX_IMAGE_BYTES)):
+            # The index keeps duplicate names apart; the fixed ZipInfo date
+            # keeps the bytes (and so the dedupe hash) the same on resubmit.
+            with zf.open(zipfile.ZipInfo(f"{i}/{name}"), 'w') as out:
+                shutil.copyfileobj(stream, out, 1 << 20)
+        if not zf.infolist():
+            raise ValueError("no .jpg, .jpeg or .png images found.")
+
+
+def run_disease_batch_job(job):
+    if not model_registry.get('disease'):
+        raise JobError("Disease prediction model not loaded.")
+    results = []
+    with zipfile.ZipFile(job.payload_path) as zf:
+        infos = zf.infolist()
+        for start in range(0, len(infos), DISEASE_BATCH_MAX_IMAGES):
+            chunk = [(info.filename.split('/', 1)[1], zf.read(info)) for info in infos[start:start + DISEASE_BATCH_MAX_IMAGES]]
+            results.extend(diagnose_images(chunk, job.params['tta']))
+            job.progress(len(results), len(infos))
+    return {"count": len(results), "results": results}
+
+
+def run_crop_bulk_job(job):
+    crop_model = model_registry.get('crop')
+    if not crop_model:
+        raise JobError("Crop prediction service is currently unavailable. Model not loaded.")
+
+    import crop_bulk
+
+    with open(job.payload_path, 'rb') as upload, open(job.result_path('csv'), 'w', newline='', encoding='utf-8') as out:
+        try:
+            rows = crop_bulk.stream_predictions(crop_model, upload, job.params['filename'],
+                                                chunk_size=int(os.getenv('CROP_BULK_CHUNK_SIZE', crop_bulk.DEFAULT_CHUNK_SIZE)),
+                                                top_k=job.params['top_k'], run=inference_pool.run)
+        except (ValueError, KeyError) as e:
+            raise JobError(f"Invalid input: {e}")
+        for chunks, text in enumerate(rows, 1):
+            out.write(text)
+            job.progress(chunks)
+    download_name = os.path.splitext(secure_filename(job.params['filename']))[0] or 'crops'
+    return {"file": f"{download_name}_recommendations.csv"}
+
+
+def run_chat_job(job):
+    payload, status = answer_chat(job.params['chat_id'], job.params['message'])
+    if status != 200:
+        raise JobError(payload['response'])
+    return payload
+
+
+job_queue.register('disease_batch', run_disease_batch_job)
+job_queue.register('crop_bulk', run_crop_bulk_job)
+job_queue.register('chat', run_chat_job)
+
+
+def submit_job(kind, params, payload=None, dedupe_key=None, serial_key=None):
+    try:
+        job_id, deduplicated = job_queue.submit(kind, params, payload, dedupe_key, serial_key)
+    except QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = '10'
+        return response
+    return jsonify({
+        "job_id": job_id,
+        "deduplicated": deduplicated,
+        "status_url": url_for('job_status', job_id=job_id),
+        "events_url": url_for('job_events', job_id=job_id),
+    }), 202
+
+
+def job_view(job):
+    if job['status'] == 'done' and 'file' in job['result']:
+        job['download_url'] = url_for('job_result', job_id=job['id'])
+    return job
+
+
+@app.route('/jobs/disease-batch', methods=['POST'])
+def submit_disease_batch_job():
+    archive = request.files.get('archive')
+    if not any(f.filename for f in request.files.getlist('images')) and not (archive and archive.filename):
+        return jsonify({"error": "Upload one or more files as 'images' or a zip file as 'archive'."}), 400
+    try:
+        return submit_job('disease_batch', {'tta': tta_requested()}, write_batch_images,
+                          dedupe_key=[model_registry.version('disease'), DISEASE_TTA_VIEWS, DISEASE_TEMPERATURE])
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"error": f"Invalid upload: {e}"}), 400
+
+
+@app.route('/jobs/crop-bulk', methods=['POST'])
+def submit_crop_bulk_job():
+    data_file = request.files.get('dataFile')
+    if not data_file or not data_file.filename:
+        return jsonify({"error": "Upload a CSV or XLSX file as 'dataFile'."}), 400
+    try:
+        top_k = int(request.form.get('top_k', 3))
+    except ValueError:
+        return jsonify({"error": "top_k must be a number."}), 400
+    return submit_job('crop_bulk', {'filename': data_file.filename, 'top_k': top_k}, data_file.read(),
+                      dedupe_key=model_registry.version('crop'))
+
+
+@app.route('/jobs/chat', methods=['POST'])
+def submit_chat_job():
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message')
+    if not user_message:
+        return jsonify({"response": "No message received."}), 400
+    chat_id = current_chat_id()
+    # The history length makes a repeated question after the answer a new job,
+    # while a double-submitted one is still deduplicated. One chat's jobs run
+    # one at a time so each turn sees the previous one in its history.
+    return submit_job('chat', {'chat_id': chat_id, 'message': user_message},
+                      dedupe_key=len(chat_store.history(chat_id)), serial_key=f"chat:{chat_id}")
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job_queue.start()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    return jsonify(job_view(job))
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    if job['status'] != 'done':
+        return jsonify(job_view(job)), 409
+    if 'file' in job['result']:
+        return send_file(job_queue.file_path(job_id, 'csv'), mimetype='text/csv',
+                         as_attachment=True, download_name=job['result']['file'])
+    return jsonify(job['result'])
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job_queue.start()
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+
+    window = None if gevent_active() else JOB_EVENTS_MAX_SECONDS
+
+    def events():
+        last_state = None
+        last_sent = opened = time.monotonic()
+        yield f"retry: {int(JOB_EVENTS_INTERVAL * 1000)}\n\n"
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield sse_event('error', {"error": "Unknown or expired job."})
+                return
+            state = (job['status'], json.dumps(job.get('progress')), job.get('position'))
+            if state != last_state:
+                last_state = state
+                last_sent = time.monotonic()
+                if job['status'] in FINISHED:
+                    yield sse_event('done', job_view(job))
+                    return
+                yield sse_event('status', job)
+            elif time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            if window is not None and time.monotonic() - opened > window:
+                return  # the client reconnects and gets the current status first
+            time.sleep(JOB_EVENTS_INTERVAL)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(job_queue.stats())
+
+
+def collect_component_metrics():
+    for name, status in model_registry.status().items():
+        yield 'gauge', 'model_loaded', {'model': name}, 1 if status['loaded'] else 0
+        yield 'gauge', 'model_load_seconds', {'model': name}, status['load_seconds']
+        yield 'gauge', 'model_rss_delta_megabytes', {'model': name}, status['rss_delta_mb']
+
+    cache = prediction_cache.stats()
+    yield 'counter', 'prediction_cache_hits_total', None, cache['hits']
+    yield 'counter', 'prediction_cache_shared_hits_total', None, cache['shared_hits']
+    yield 'counter', 'prediction_cache_misses_total', None, cache['misses']
+    yield 'gauge', 'prediction_cache_entries', None, cache['entries']
+
+    chat_cache = chat_response_cache.stats()
+    for kind in ('exact', 'similar', 'kb'):
+        yield 'counter', 'chat_cache_hits_total', {'kind': kind}, chat_cache[f'{kind}_hits']
+    yield 'counter', 'chat_cache_misses_total', None, chat_cache['misses']
+
+    batcher = disease_batcher.stats()
+    yield 'counter', 'disease_batches_total', None, batcher['batches']
+    yield 'counter', 'disease_batch_items_total', None, batcher['items']
+    yield 'counter', 'disease_direct_batches_total', None, batcher['direct_batches']
+    yield 'counter', 'disease_direct_batch_items_total', None, batcher['direct_items']
+    yield 'gauge', 'disease_batch_queued', None, batcher['queued']
+
+    jobs = job_queue.stats()
+    for status in ('queued', 'running', 'done', 'failed'):
+        yield 'gauge', 'jobs', {'status': status}, jobs['jobs'].get(status, 0)
+    yield 'counter', 'jobs_deduplicated_total', None, jobs['deduplicated']
+    yield 'counter', 'jobs_rejected_total', None, jobs['rejected']
+
+
+metrics.describe('chat_streams_total', 'counter', "Streamed chat replies by outcome.")
+metrics.describe('model_load_seconds', 'gauge', "Time taken to load each model.")
+metrics.add_collector(collect_component_metrics)
+
+
+@app.route('/metrics')
+def metrics_view():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 # if __name__ == '__main__':
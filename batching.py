@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _PendingItem:
+    __slots__ = ('array', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, array):
+        self.array = array
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingPredictor:
+    """Collects single-sample predict calls and runs them as one batched forward pass.
+
+    ``predict_fn`` receives a stacked ``(N, ...)`` array and must return one
+    row of output per input row. Calls from concurrent request threads are
+    merged until either ``max_batch_size`` samples are waiting or the oldest
+    one has waited ``max_wait_ms``.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, name='model'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._queue_time_total = 0.0
+        self._queue_time_max = 0.0
+        self._predict_time_total = 0.0
+        self._direct_batches = 0
+        self._direct_items = 0
+        self._direct_time_total = 0.0
+
+    def predict(self, array, timeout=None):
+        """Predict a single sample (no batch axis) and return its output row."""
+        self._ensure_worker()
+        item = _PendingItem(np.asarray(array))
+        self._queue.put(item)
+        if not item.done.wait(timeout):
+            raise TimeoutError(f"{self.name} batch prediction timed out")
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def predict_many(self, batch):
+        """Run an already-batched array directly, bypassing the queue.
+
+        These calls are counted separately as ``direct_batches`` /
+        ``direct_items`` so the queue statistics keep describing merging.
+        """
+        started = time.perf_counter()
+        outputs = np.asarray(self.predict_fn(batch))
+        with self._stats_lock:
+            self._direct_batches += 1
+            self._direct_items += len(batch)
+            self._direct_time_total += time.perf_counter() - started
+        return outputs
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches
+            direct = self._direct_batches
+            return {
+                'name': self.name,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queued': self._queue.qsize(),
+                'batches': batches,
+                'items': self._items,
+                'avg_batch_size': (self._items / batches) if batches else 0.0,
+                'max_batch_seen': self._max_batch_seen,
+                'avg_queue_ms': (self._queue_time_total / self._items * 1000.0) if self._items else 0.0,
+                'max_queue_ms': self._queue_time_max * 1000.0,
+                'avg_predict_ms': (self._predict_time_total / batches * 1000.0) if batches else 0.0,
+                'direct_batches': direct,
+                'direct_items': self._direct_items,
+                'avg_direct_predict_ms': (self._direct_time_total / direct * 1000.0) if direct else 0.0,
+            }
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so a worker started in the gunicorn
+        # master (e.g. with --preload) is restarted in each child process.
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                outputs = np.asarray(self.predict_fn(np.stack([item.array for item in batch])))
+                if len(outputs) != len(batch):
+                    raise ValueError(f"{self.name} returned {len(outputs)} rows for a batch of {len(batch)}")
+                for item, row in zip(batch, outputs):
+                    item.result = row
+            except Exception as e:
+                print(f"Batched prediction error ({self.name}): {e}")
+                for item in batch:
+                    item.error = e
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                self._predict_time_total += finished - started
+                for item in batch:
+                    waited = started - item.enqueued_at
+                    self._queue_time_total += waited
+                    self._queue_time_max = max(self._queue_time_max, waited)
+
+            for item in batch:
+                item.done.set()
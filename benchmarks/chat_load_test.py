@@ -0,0 +1,172 @@
+"""Concurrent chat load test against the offline Gemini stand-in.
+
+Starts gunicorn (gunicorn.conf.py) once per worker class with GEMINI_FAKE=1,
+keeps ``--concurrency`` chats in flight and, at the same time, sends crop
+predictions one after another to show whether slow chats starve the other
+routes. Compare the worker classes:
+
+    python benchmarks/chat_load_test.py --worker-class gevent --worker-class gthread
+
+or point it at a server that is already running with ``--url``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CROP_FORM = {
+    'location': 'Indore',
+    'soil_type': 'Loamy',
+    'rainfall': '800',
+    'temperature': '30',
+    'humidity': '65',
+    'season': 'Kharif',
+}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def post(url, body, headers, timeout):
+    request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def chat_once(base_url, i, stream, timeout):
+    path = '/chat/stream' if stream else '/chat'
+    body = json.dumps({'message': f"How do I treat leaf spot? ({i})"}).encode()
+    return post(base_url + path, body, {'Content-Type': 'application/json'}, timeout)
+
+
+def crop_probe(base_url, stop, latencies, errors, timeout):
+    body = urllib.parse.urlencode(CROP_FORM).encode()
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    while not stop.is_set():
+        try:
+            latencies.append(post(base_url + '/crop-predict', body, headers, timeout))
+        except (OSError, urllib.error.URLError):
+            errors.append(1)
+        time.sleep(0.05)
+
+
+def run_load(base_url, concurrency, total, stream, timeout):
+    chat_latencies, chat_errors = [], []
+    crop_latencies, crop_errors = [], []
+    stop = threading.Event()
+    prober = threading.Thread(target=crop_probe, args=(base_url, stop, crop_latencies, crop_errors, timeout), daemon=True)
+    prober.start()
+
+    def one(i):
+        try:
+            chat_latencies.append(chat_once(base_url, i, stream, timeout))
+        except (OSError, urllib.error.URLError) as e:
+            chat_errors.append(str(e))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    return {
+        'chats': len(chat_latencies),
+        'chat_errors': len(chat_errors),
+        'elapsed_s': elapsed,
+        'chats_per_s': len(chat_latencies) / elapsed if elapsed else 0.0,
+        'chat_p50_ms': (percentile(chat_latencies, 50) or 0) * 1000,
+        'chat_p95_ms': (percentile(chat_latencies, 95) or 0) * 1000,
+        'crop_requests': len(crop_latencies),
+        'crop_errors': len(crop_errors),
+        'crop_p50_ms': (percentile(crop_latencies, 50) or 0) * 1000,
+        'crop_p95_ms': (percentile(crop_latencies, 95) or 0) * 1000,
+    }
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + '/models/status', timeout=2):
+                return
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.25)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def start_server(worker_class, args):
+    env = dict(os.environ)
+    env.update({
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'PORT': str(args.port),
+        'GEMINI_FAKE': '1',
+        'GEMINI_FAKE_FIRST_TOKEN_MS': str(args.first_token_ms),
+        'GEMINI_FAKE_TOKEN_MS': str(args.token_ms),
+        'PRELOAD_MODELS': env.get('PRELOAD_MODELS', 'crop,crop_fast'),
+    })
+    env.setdefault('GEMINI_API_KEY', 'load-test')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return process
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test /chat with the offline Gemini stand-in.")
+    parser.add_argument('--url', help="Test an already running server instead of starting gunicorn.")
+    parser.add_argument('--worker-class', action='append', dest='worker_classes')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--token-ms', type=float, default=10)
+    parser.add_argument('--stream', action='store_true', help="Use /chat/stream instead of /chat.")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.url:
+        results[args.url] = run_load(args.url.rstrip('/'), args.concurrency, args.requests, args.stream, args.timeout)
+    else:
+        base_url = f"http://127.0.0.1:{args.port}"
+        for worker_class in args.worker_classes or ['gevent', 'gthread']:
+            process = start_server(worker_class, args)
+            try:
+                wait_until_ready(base_url, process)
+                results[worker_class] = run_load(base_url, args.concurrency, args.requests, args.stream, args.timeout)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    print(f"{'target':<24}{'chats/s':>9}{'chat p50':>10}{'chat p95':>10}{'crop p50':>10}{'crop p95':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['chats_per_s']:>9.1f}{r['chat_p50_ms']:>8.0f}ms{r['chat_p95_ms']:>8.0f}ms"
+              f"{r['crop_p50_ms']:>8.0f}ms{r['crop_p95_ms']:>8.0f}ms{r['chat_errors'] + r['crop_errors']:>8}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
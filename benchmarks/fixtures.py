@@ -0,0 +1,71 @@
+"""Offline inputs for the benchmarks: leaf images, crop rows and a stub disease model."""
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CROP_DATA = os.path.join(ROOT, 'Data', 'crop_prediction.xlsx')
+DEFAULT_RESOLUTIONS = (256, 1024, 3000)
+
+
+def leaf_image(side, seed=0, quality=90):
+    """JPEG bytes of a synthetic leaf: a green blade with brown lesions and
+    sensor-like noise, so JPEG decoding does realistic work."""
+    rng = np.random.default_rng(seed)
+    img = Image.new('RGB', (side, side), tuple(int(v) for v in rng.integers(150, 210, 3)))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((side * 0.1, side * 0.25, side * 0.9, side * 0.75),
+                 fill=(int(rng.integers(40, 80)), int(rng.integers(110, 160)), int(rng.integers(30, 60))))
+    for _ in range(12):
+        x, y = rng.uniform(0.25, 0.75, 2) * side
+        r = rng.uniform(0.01, 0.05) * side
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(int(rng.integers(90, 130)), int(rng.integers(60, 90)), 30))
+    img = img.filter(ImageFilter.GaussianBlur(max(1, side // 400)))
+    noise = rng.normal(0, 8, (side, side, 3))
+    img = Image.fromarray(np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+    buffered = io.BytesIO()
+    img.save(buffered, format='JPEG', quality=quality)
+    return buffered.getvalue()
+
+
+def leaf_images(resolutions=DEFAULT_RESOLUTIONS, per_resolution=4):
+    return {side: [leaf_image(side, seed=side * 100 + i) for i in range(per_resolution)] for side in resolutions}
+
+
+def crop_rows(count=200, seed=0, path=CROP_DATA):
+    """Form submissions sampled (with replacement) from the training data."""
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    sample = df.sample(n=count, replace=True, random_state=seed)
+    return [
+        {
+            'location': row['Location'],
+            'soil_type': row['Soil Type'],
+            'rainfall': str(row['Rainfall (mm)']),
+            'temperature': str(row['Temperature (°C)']),
+            'humidity': str(row['Humidity (%)']),
+            'season': row['Season'],
+        }
+        for _, row in sample.iterrows()
+    ]
+
+
+class StubDiseaseModel:
+    """Keras-compatible stand-in used when models/plant_disease_model.h5 is
+    absent. Sleeps ``base_ms + per_image_ms * N`` per batch, like a model
+    whose cost grows with the batch."""
+
+    def __init__(self, classes=15, base_ms=20.0, per_image_ms=5.0):
+        self.classes = classes
+        self.base = base_ms / 1000.0
+        self.per_image = per_image_ms / 1000.0
+
+    def predict(self, batch, verbose=0):
+        time.sleep(self.base + self.per_image * len(batch))
+        logits = batch.reshape(len(batch), -1)[:, :self.classes] * 10.0
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return (exp / exp.sum(axis=1, keepdims=True)).astype(np.float32)
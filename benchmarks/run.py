@@ -0,0 +1,381 @@
+"""Offline latency / throughput benchmarks for the Farm-Mitra endpoints.
+
+Drives the Flask app in-process with synthetic leaf images at several
+resolutions, crop rows sampled from Data/crop_prediction.xlsx and the
+offline Gemini stand-in (fake_llm.py). Reports p50/p95/p99 latency, req/s
+and peak RSS per endpoint, plus per-stage timings (decode, resize,
+preview, predict, render), and writes the results as JSON named after the
+current commit:
+
+    python benchmarks/run.py run --requests 50 --concurrency 4
+    python benchmarks/run.py compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+When models/plant_disease_model.h5 is absent a stub model with a fixed
+per-batch cost stands in (``--disease-model stub`` forces it).
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def summarize(latencies):
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None}
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+    }
+
+
+class RssSampler:
+    """Peak resident memory while a block runs (sampled every few ms)."""
+
+    def __init__(self, interval=0.005):
+        from model_registry import current_rss_bytes
+        self._rss = current_rss_bytes
+        self.interval = interval
+        self.start = self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+        return False
+
+
+def measure(fn, requests, concurrency):
+    latencies, errors = [], []
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            ok = fn(i)
+        except Exception as e:
+            errors.append(str(e))
+            return
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append('bad status')
+
+    fn(0)  # warm up: loads models, fills per-thread buffers
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    result = {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'elapsed_s': elapsed,
+        'req_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'peak_rss_mb': rss.peak / (1024 * 1024),
+        'rss_growth_mb': (rss.peak - rss.start) / (1024 * 1024),
+    }
+    result.update(summarize(latencies))
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def endpoint_benchmarks(app_module, args, images, rows):
+    client_app = app_module.app
+
+    response_bytes = {}
+
+    def disease(side, url='/disease-predict'):
+        def fn(i):
+            data = images[side][i % len(images[side])]
+            r = client_app.test_client().post(url, data={'imageUpload': (io.BytesIO(data), 'leaf.jpg')},
+                                              content_type='multipart/form-data')
+            response_bytes.setdefault((url, side), []).append(len(r.data))
+            return r.status_code == 200 and b'Error processing image' not in r.data
+        return fn
+
+    def disease_batch(i):
+        side = args.resolutions[len(args.resolutions) // 2]
+        files = [(io.BytesIO(data), f'leaf{k}.jpg') for k, data in enumerate(images[side])]
+        r = client_app.test_client().post('/disease-predict/batch', data={'images': files}, content_type='multipart/form-data')
+        return r.status_code == 200
+
+    def crop(i):
+        r = client_app.test_client().post('/crop-predict', data=rows[i % len(rows)])
+        return r.status_code == 200 and b'best crop to grow' in r.data
+
+    def chat(i):
+        r = client_app.test_client().post('/chat', json={'message': f"How should I water my crop this week? ({i})"})
+        return r.status_code == 200
+
+    ttfts = []
+
+    def chat_stream(i):
+        started = time.perf_counter()
+        r = client_app.test_client().post('/chat/stream', json={'message': f"Which fertilizer suits wheat? ({i})"}, buffered=False)
+        first = True
+        for chunk in r.response:
+            if first and b'event: token' in chunk:
+                ttfts.append(time.perf_counter() - started)
+                first = False
+        r.close()
+        return r.status_code == 200 and not first
+
+    selected = set(args.endpoints)
+    results = {}
+    for side in args.resolutions:
+        if 'disease' in selected:
+            results[f'disease_{side}px'] = measure(disease(side), args.requests, args.concurrency)
+        if 'disease_json' in selected:
+            results[f'disease_json_{side}px'] = measure(disease(side, '/disease-predict?format=json'),
+                                                        args.requests, args.concurrency)
+        if 'disease_tta' in selected:
+            results[f'disease_tta_{side}px'] = measure(disease(side, '/disease-predict?format=json&tta=1'),
+                                                       args.requests, args.concurrency)
+    for (url, side), sizes in response_bytes.items():
+        name = {'/disease-predict': 'disease', '/disease-predict?format=json': 'disease_json',
+                '/disease-predict?format=json&tta=1': 'disease_tta'}[url] + f"_{side}px"
+        results[name]['response_kb'] = sum(sizes) / len(sizes) / 1024
+    if 'disease_batch' in selected:
+        results['disease_batch'] = measure(disease_batch, max(1, args.requests // 4), args.concurrency)
+    if 'crop' in selected:
+        results['crop'] = measure(crop, args.requests, args.concurrency)
+    if 'chat' in selected:
+        results['chat'] = measure(chat, args.requests, args.concurrency)
+    if 'chat_stream' in selected:
+        results['chat_stream'] = measure(chat_stream, args.requests, args.concurrency)
+        results['chat_stream']['ttft'] = summarize(ttfts[1:])
+    return results
+
+
+def stage_benchmarks(app_module, args, images, rows):
+    """Time each stage of a request on its own, outside the HTTP layer."""
+    import image_pipeline
+
+    stages = {}
+    app = app_module.app
+    repeat = max(3, args.requests // 5)
+
+    if 'disease' in args.endpoints:
+        for side in args.resolutions:
+            timings = {'decode': [], 'resize': [], 'preview': [], 'predict': [], 'render': []}
+            for i in range(repeat):
+                data = images[side][i % len(images[side])]
+                t0 = time.perf_counter()
+                img = image_pipeline.open_image(io.BytesIO(data), min_size=app_module.DISEASE_DECODE_SIZE)
+                img.load()
+                t1 = time.perf_counter()
+                array = image_pipeline.to_model_input(img, out=image_pipeline.input_buffer())
+                t2 = time.perf_counter()
+                preview = None
+                if app_module.DISEASE_PREVIEW_MODE == 'thumbnail':
+                    preview = image_pipeline.thumbnail_data_url(img, app_module.DISEASE_PREVIEW_SIZE)
+                t3 = time.perf_counter()
+                result = app_module.describe_prediction(app_module.predict_disease(array))
+                t4 = time.perf_counter()
+                with app.test_request_context():
+                    app_module.render_template('disease_detect.html', image_url=preview, image_uploaded=True,
+                                               disease_identified=result['disease'],
+                                               confidence=f"{result['confidence']}%",
+                                               advice=app_module.advice_book.get(result['disease']))
+                t5 = time.perf_counter()
+                for name, value in zip(timings, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                    timings[name].append(value)
+            stages[f'disease_{side}px'] = {name: summarize(values) for name, values in timings.items()}
+
+    if 'crop' in args.endpoints:
+        timings = {'predict': [], 'render': []}
+        crop_model = app_module.model_registry.get('crop')
+        for i in range(repeat):
+            form = rows[i % len(rows)]
+            row = [form['location'], form['soil_type'], float(form['rainfall']), float(form['temperature']),
+                   float(form['humidity']), form['season']]
+            t0 = time.perf_counter()
+            prediction = app_module.predict_crop(crop_model, row)
+            t1 = time.perf_counter()
+            with app.test_request_context():
+                app_module.render_template('crop_predict.html', prediction_result=f"The best crop to grow is: {prediction}")
+            t2 = time.perf_counter()
+            timings['predict'].append(t1 - t0)
+            timings['render'].append(t2 - t1)
+        stages['crop'] = {name: summarize(values) for name, values in timings.items()}
+    return stages
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def load_app(args):
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+    os.environ['GEMINI_FAKE'] = '1'
+    os.environ['GEMINI_FAKE_FIRST_TOKEN_MS'] = str(args.llm_first_token_ms)
+    os.environ['GEMINI_FAKE_TOKEN_MS'] = str(args.llm_token_ms)
+    os.environ.setdefault('CHAT_STORE', 'memory')
+    if not args.cache:
+        # Repeated inputs would otherwise be served from the caches.
+        os.environ['PREDICTION_CACHE_SIZE'] = '0'
+        os.environ['CHAT_CACHE_SIZE'] = '0'
+        os.environ['CHAT_KB_ANSWERS'] = '0'
+    os.chdir(ROOT)
+    import app as app_module
+
+    disease_path = os.path.join(ROOT, 'models', 'plant_disease_model.h5')
+    use_stub = args.disease_model == 'stub' or (args.disease_model == 'auto' and not os.path.exists(disease_path))
+    if use_stub and os.getenv('DISEASE_MODEL_BACKEND', 'keras') == 'keras' and not os.getenv('MODEL_SERVER_SOCKET'):
+        stub = fixtures.StubDiseaseModel(base_ms=args.stub_base_ms, per_image_ms=args.stub_per_image_ms)
+        app_module.model_registry.register('disease', lambda: stub)
+    return app_module, use_stub
+
+
+def run(args):
+    app_module, use_stub = load_app(args)
+    images = fixtures.leaf_images(args.resolutions, per_resolution=args.images_per_resolution)
+    rows = fixtures.crop_rows(count=max(args.requests, 50))
+
+    endpoints = endpoint_benchmarks(app_module, args, images, rows)
+    stages = stage_benchmarks(app_module, args, images, rows)
+
+    commit, dirty = git_revision()
+    results = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'label': args.label,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'disease_model': 'stub' if use_stub else os.getenv('DISEASE_MODEL_BACKEND', 'keras'),
+            'config': {k: v for k, v in vars(args).items() if k not in ('func', 'out')},
+        },
+        'endpoints': endpoints,
+        'stages': stages,
+    }
+
+    os.makedirs(args.out, exist_ok=True)
+    name = args.label or (commit[:12] + ('-dirty' if dirty else ''))
+    path = os.path.join(args.out, f"{name}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'endpoint':<22}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'peak RSS':>10}{'errors':>8}")
+    for name_, r in endpoints.items():
+        print(f"{name_:<22}{r['req_per_s']:>8.1f}{r['p50_ms'] or 0:>7.1f}ms{r['p95_ms'] or 0:>7.1f}ms"
+              f"{r['p99_ms'] or 0:>7.1f}ms{r['peak_rss_mb']:>8.0f}MB{r['errors']:>8}")
+    for name_, timings in stages.items():
+        print(f"{name_:<22}" + '  '.join(f"{stage} {t['p50_ms']:.2f}ms" for stage, t in timings.items()))
+    print(f"Results written to {path}")
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        new = json.load(f)
+
+    def change(before, after):
+        return (after - before) / before if before else 0.0
+
+    regressions = []
+    print(f"{'endpoint':<22}{'p50':>22}{'p95':>22}{'req/s':>22}")
+    for name in sorted(set(old['endpoints']) & set(new['endpoints'])):
+        a, b = old['endpoints'][name], new['endpoints'][name]
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'req_per_s'):
+            delta = change(a[key] or 0, b[key] or 0)
+            cells.append(f"{a[key] or 0:.1f} -> {b[key] or 0:.1f} ({delta:+.0%})")
+            worse = delta < -args.threshold if key == 'req_per_s' else delta > args.threshold
+            if worse:
+                regressions.append(f"{name} {key}")
+        print(f"{name:<22}" + ''.join(f"{cell:>22}" for cell in cells))
+
+    for name in sorted(set(old.get('stages', {})) & set(new.get('stages', {}))):
+        for stage, timing in new['stages'][name].items():
+            before = old['stages'][name].get(stage, {}).get('p50_ms')
+            if before is None or timing['p50_ms'] is None:
+                continue
+            delta = change(before, timing['p50_ms'])
+            print(f"  {name}.{stage:<18}{before:>8.2f} -> {timing['p50_ms']:.2f} ms ({delta:+.0%})")
+            if delta > args.threshold:
+                regressions.append(f"{name}.{stage} p50")
+
+    print(f"Baseline {old['meta']['commit'][:12]} vs candidate {new['meta']['commit'][:12]}")
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}: " + ', '.join(regressions))
+        if args.fail_on_regression:
+            raise SystemExit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Farm-Mitra endpoints offline.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run')
+    p.add_argument('--endpoints', type=lambda s: s.split(','),
+                   default=['disease', 'disease_json', 'disease_tta', 'disease_batch', 'crop', 'chat', 'chat_stream'])
+    p.add_argument('--requests', type=int, default=50)
+    p.add_argument('--concurrency', type=int, default=4)
+    p.add_argument('--resolutions', type=lambda s: [int(v) for v in s.split(',')], default=list(fixtures.DEFAULT_RESOLUTIONS))
+    p.add_argument('--images-per-resolution', type=int, default=4)
+    p.add_argument('--disease-model', choices=['auto', 'real', 'stub'], default='auto')
+    p.add_argument('--stub-base-ms', type=float, default=20.0)
+    p.add_argument('--stub-per-image-ms', type=float, default=5.0)
+    p.add_argument('--llm-first-token-ms', type=float, default=200.0)
+    p.add_argument('--llm-token-ms', type=float, default=20.0)
+    p.add_argument('--cache', action='store_true', help="Keep prediction and chat caches enabled.")
+    p.add_argument('--label', help="Results file name (default: current commit).")
+    p.add_argument('--out', default=RESULTS_DIR)
+    p.set_defaults(func=run)
+
+    p = sub.add_parser('compare')
+    p.add_argument('baseline')
+    p.add_argument('candidate')
+    p.add_argument('--threshold', type=float, default=0.10, help="Relative change counted as a regression.")
+    p.add_argument('--fail-on-regression', action='store_true')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+STOPWORDS = {
+    'a', 'an', 'the', 'to', 'is', 'are', 'was', 'were',
+    'my', 'i', 'me', 'can', 'could', 'do', 'does', 'should', 'for', 'of', 'in', 'on', 'at', 'and', 'or',
+    'with', 'please', 'tell', 'about', 'best', 'it', 'its', 'this', 'that', 'there', 'any', 'give', 'use',
+    'get', 'from', 'be', 'you', 'your', 'we', 'our', 'plant', 'some', 'need', 'want', 'know', 'way', 'good',
+}
+
+# Kept in every key: "when should I sow wheat" and "where should I sow
+# wheat" need different answers.
+QUESTION_WORDS = {'how', 'what', 'which', 'why', 'when', 'where'}
+
+# Words farmers use interchangeably for the same intent. Only the similarity
+# score folds them; the exact key keeps the words as asked.
+SYNONYMS = {
+    'treat': 'treat', 'treatment': 'treat', 'cure': 'treat', 'medicine': 'treat', 'remedy': 'treat',
+    'control': 'treat', 'manage': 'treat', 'spray': 'treat', 'pesticide': 'treat', 'fungicide': 'treat',
+    'dawai': 'treat', 'dawa': 'treat', 'dava': 'treat', 'solution': 'treat',
+    'prevent': 'prevent', 'prevention': 'prevent', 'avoid': 'prevent', 'stop': 'prevent',
+    'fertilizer': 'fertilizer', 'fertiliser': 'fertilizer', 'manure': 'fertilizer', 'nutrient': 'fertilizer',
+    'symptom': 'symptom', 'sign': 'symptom', 'identify': 'symptom',
+}
+
+# Label words that farmers rarely type; not required for a knowledge-base match.
+OPTIONAL_LABEL_WORDS = {'virus', 'two', 'spotted', 'bell'}
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith('oes'):
+        return word[:-2]
+    if len(word) > 4 and word.endswith('es') and word[-3] in 'sxz':
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _content_words(text):
+    return frozenset(_stem(word) for word in re.findall(r'[a-z0-9]+', text.lower()) if word not in STOPWORDS)
+
+
+def question_tokens(text):
+    """Content words of ``text``, stemmed and mapped to a canonical synonym."""
+    return frozenset(SYNONYMS.get(word, word) for word in _content_words(text))
+
+
+def normalize(text):
+    """Exact-match key: the question's content words as asked, order-insensitive."""
+    return ' '.join(sorted(_content_words(text)))
+
+
+def label_tokens(label):
+    words = re.sub(r'([a-z])([A-Z])', r'\1 \2', label).replace('_', ' ')
+    return frozenset(_stem(w) for w in words.lower().split())
+
+
+class DiseaseKnowledgeBase:
+    """Answers questions that name one known disease from ``disease_solutions``.
+
+    ``solutions`` may be a callable returning the current dict (e.g.
+    ``AdviceBook.solutions``); it is called on every question, so reloaded
+    advice is used straight away.
+    """
+
+    def __init__(self, labels, solutions):
+        self.solutions = solutions if callable(solutions) else (lambda: solutions)
+        self.labels = []
+        for label in labels:
+            tokens = label_tokens(label)
+            if 'healthy' in tokens:
+                continue
+            self.labels.append((label, tokens - OPTIONAL_LABEL_WORDS))
+
+    def match(self, question, solutions=None):
+        solutions = self.solutions() if solutions is None else solutions
+        tokens = question_tokens(question)
+        matches = [(len(required), label) for label, required in self.labels
+                   if required <= tokens and label in solutions]
+        if not matches:
+            return None
+        matches.sort(reverse=True)
+        if len(matches) > 1 and matches[0][0] == matches[1][0]:
+            return None  # e.g. "early and late blight": let the model answer
+        return matches[0][1]
+
+    def answer(self, question):
+        solutions = self.solutions()
+        label = self.match(question, solutions)
+        if label is None:
+            return None
+        info = solutions[label]
+        name = label.replace('___', ' ').replace('__', ' ').replace('_', ' ')
+        sections = [f"{name}: {info['description']}"]
+        for title, key in (("Symptoms", 'common_symptoms'), ("What to do now", 'immediate_actions'),
+                           ("Prevention", 'prevention_tips')):
+            if info.get(key):
+                sections.append(f"{title}:\n" + '\n'.join(f"- {item}" for item in info[key]))
+        for title, key in (("Medicine (dawai)", 'dawai'), ("Fertilizer", 'fertilizer'), ("General advice", 'general_advice')):
+            if info.get(key):
+                sections.append(f"{title}: {info[key]}")
+        return '\n\n'.join(sections)
+
+
+class ChatResponseCache:
+    """LRU + TTL cache of chat answers for questions asked without context.
+
+    Lookups first try the normalised question exactly, then (when
+    ``similarity`` < 1) the most similar cached question by Jaccard overlap
+    of synonym-folded content words, found through a word -> questions
+    index.
+    """
+
+    def __init__(self, max_entries=512, ttl=86400, similarity=0.8):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self.similarity = float(similarity)
+
+        self._entries = OrderedDict()  # key -> (expires, tokens, answer)
+        self._index = {}  # token -> set of keys
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.kb_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, question):
+        if not self.enabled:
+            return None
+        tokens = question_tokens(question)
+        key = normalize(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return entry[2]
+                self._discard(key)
+
+            if self.similarity < 1.0 and len(tokens) >= 2:
+                best_key, best_score = None, 0.0
+                candidates = set()
+                for token in tokens:
+                    candidates.update(self._index.get(token, ()))
+                for candidate in candidates:
+                    expires, cached_tokens, _ = self._entries[candidate]
+                    if expires <= now:
+                        continue
+                    score = len(tokens & cached_tokens) / len(tokens | cached_tokens)
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None and best_score >= self.similarity:
+                    self._entries.move_to_end(best_key)
+                    self.similar_hits += 1
+                    return self._entries[best_key][2]
+
+            self.misses += 1
+            return None
+
+    def record_kb_hit(self):
+        with self._lock:
+            self.kb_hits += 1
+
+    def set(self, question, answer):
+        if not self.enabled:
+            return
+        tokens = question_tokens(question)
+        if not tokens - QUESTION_WORDS:
+            return
+        key = normalize(question)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.time() + self.ttl, tokens, answer)
+            for token in tokens:
+                self._index.setdefault(token, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            keys = self._index.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[token]
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits + self.kb_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'similarity': self.similarity,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'kb_hits': self.kb_hits,
+                'misses': self.misses,
+                'hit_rate': (hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,198 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def _first_sentence(text, limit):
+    text = ' '.join(text.split())
+    match = re.match(r'(.+?[.!?])(\s|$)', text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + '...'
+
+
+class ChatStore:
+    """Conversation history kept on the server, keyed by a chat id.
+
+    Only the newest turns that fit in ``max_tokens`` are replayed to the
+    model. Older turns are folded into a short extractive summary capped at
+    ``summary_tokens``, so the prompt sent per message stays the same size
+    however long the conversation gets. Subclasses implement ``_read`` /
+    ``_write`` for the storage itself.
+    """
+
+    def __init__(self, max_tokens=2000, summary_tokens=300):
+        self.max_tokens = int(max_tokens)
+        self.summary_tokens = int(summary_tokens)
+
+    def history(self, chat_id):
+        """Gemini ``start_chat`` history for ``chat_id``."""
+        summary, turns = self._read(chat_id)
+        history = []
+        if summary:
+            history.append({'role': 'user', 'parts': [{'text': SUMMARY_PREFIX + summary}]})
+            history.append({'role': 'model', 'parts': [{'text': "Understood."}]})
+        for user_text, model_text in turns:
+            history.append({'role': 'user', 'parts': [{'text': user_text}]})
+            history.append({'role': 'model', 'parts': [{'text': model_text}]})
+        return history
+
+    def add_turn(self, chat_id, user_text, model_text):
+        with self._transaction():
+            summary, turns = self._read(chat_id)
+            turns.append((user_text, model_text))
+            summary, turns = self._compact(summary, turns)
+            self._write(chat_id, summary, turns)
+
+    def _compact(self, summary, turns):
+        lines = summary.split('\n') if summary else []
+        used = sum(estimate_tokens(u) + estimate_tokens(m) for u, m in turns)
+        while len(turns) > 1 and used > self.max_tokens:
+            user_text, model_text = turns.pop(0)
+            used -= estimate_tokens(user_text) + estimate_tokens(model_text)
+            lines.append(f"- Asked: {_first_sentence(user_text, 160)} Answer: {_first_sentence(model_text, 200)}")
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+
+        if used > self.max_tokens:
+            # A single oversized turn: keep its start rather than drop it.
+            user_text, model_text = turns[0]
+            chars = self.max_tokens * 4
+            turns[0] = (user_text[:chars // 4], model_text[:chars * 3 // 4])
+        return '\n'.join(lines), turns
+
+    def _transaction(self):
+        raise NotImplementedError
+
+    def _read(self, chat_id):
+        raise NotImplementedError
+
+    def _write(self, chat_id, summary, turns):
+        raise NotImplementedError
+
+
+class MemoryChatStore(ChatStore):
+    """Per-process store; conversations are lost on restart and not shared
+    between gunicorn workers."""
+
+    def __init__(self, max_conversations=1000, ttl=86400, **kwargs):
+        super().__init__(**kwargs)
+        self.max_conversations = int(max_conversations)
+        self.ttl = float(ttl)
+        self._chats = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _transaction(self):
+        return self._lock
+
+    def _read(self, chat_id):
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None or entry[0] + self.ttl <= time.time():
+                return '', []
+            return entry[1], list(entry[2])
+
+    def _write(self, chat_id, summary, turns):
+        with self._lock:
+            self._chats[chat_id] = (time.time(), summary, list(turns))
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_conversations:
+                self._chats.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'conversations': len(self._chats),
+                    'max_conversations': self.max_conversations, 'ttl': self.ttl,
+                    'max_tokens': self.max_tokens, 'summary_tokens': self.summary_tokens}
+
+
+class SQLiteChatStore(ChatStore):
+    """Store shared by every worker on the box through one SQLite file."""
+
+    def __init__(self, path, ttl=86400, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.ttl = float(ttl)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # Same per-thread, per-process connections as PredictionCache.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chats ("
+                "chat_id TEXT PRIMARY KEY, summary TEXT NOT NULL, turns TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add_turn(self, chat_id, user_text, model_text):
+        try:
+            super().add_turn(chat_id, user_text, model_text)
+        except sqlite3.Error as e:
+            print(f"Chat store write error: {e}")
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._connection())
+
+    def _read(self, chat_id):
+        try:
+            row = self._connection().execute(
+                "SELECT summary, turns FROM chats WHERE chat_id = ? AND updated > ?",
+                (chat_id, time.time() - self.ttl),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Chat store read error: {e}")
+            return '', []
+        if row is None:
+            return '', []
+        return row[0], [tuple(turn) for turn in json.loads(row[1])]
+
+    def _write(self, chat_id, summary, turns):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO chats (chat_id, summary, turns, updated) VALUES (?, ?, ?, ?)",
+            (chat_id, summary, json.dumps(turns), now),
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            conn.execute("DELETE FROM chats WHERE updated <= ?", (now - self.ttl,))
+
+    def stats(self):
+        try:
+            count = self._connection().execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+        except sqlite3.Error:
+            count = None
+        return {'backend': 'sqlite', 'path': self.path, 'conversations': count, 'ttl': self.ttl,
+                'max_tokens': self.max_tokens, 'summary_tokens': self.summary_tokens}
+
+
+class _ImmediateTransaction:
+    # Takes the write lock before reading so two workers appending to the
+    # same conversation cannot lose a turn.
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
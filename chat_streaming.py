@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StreamStats:
+    """Counters for streamed chat replies, including time-to-first-token.
+
+    ``on_record(outcome, ttft)``, if given, is called for every finished
+    stream (e.g. to feed a latency histogram).
+    """
+
+    def __init__(self, on_record=None):
+        self.on_record = on_record
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.ttft_total = 0.0
+        self.ttft_max = 0.0
+        self.ttft_count = 0
+        self.last_ttft = None
+
+    def record(self, outcome, ttft=None):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if ttft is not None:
+                self.ttft_count += 1
+                self.ttft_total += ttft
+                self.ttft_max = max(self.ttft_max, ttft)
+                self.last_ttft = ttft
+        if self.on_record:
+            self.on_record(outcome, ttft)
+
+    def begin(self):
+        with self._lock:
+            self.started += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'failed': self.failed,
+                'avg_ttft_ms': (self.ttft_total / self.ttft_count * 1000.0) if self.ttft_count else None,
+                'max_ttft_ms': self.ttft_max * 1000.0 if self.ttft_count else None,
+                'last_ttft_ms': self.last_ttft * 1000.0 if self.last_ttft is not None else None,
+            }
+
+
+def stream_reply(chat_session, message, safety_settings, stats, on_complete, describe_error):
+    """Yield SSE events for a streamed ``send_message`` call.
+
+    ``on_complete(text, answered)`` runs once the whole reply has arrived
+    (``answered`` is False when the model returned no text and ``text`` is
+    the fallback message) and returns extra fields for the final ``done``
+    event. ``describe_error(e, response)`` returns the user-facing message:
+    with ``e=None`` it explains an empty (e.g. blocked) ``response`` and
+    becomes that fallback text; with an exception it is sent in an
+    ``error`` event. If the client disconnects, the WSGI server closes
+    this generator and the upstream stream is abandoned unread.
+    """
+    stats.begin()
+    started = time.perf_counter()
+    ttft = None
+    parts = []
+    response = None
+    outcome = 'failed'
+    try:
+        response = chat_session.send_message(message, stream=True, safety_settings=safety_settings)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                text = ''
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            parts.append(text)
+            yield sse_event('token', {'text': text})
+
+        full_text = ''.join(parts)
+        answered = bool(full_text)
+        if not answered:
+            full_text = describe_error(None, response)
+            yield sse_event('token', {'text': full_text})
+        done = {'response': full_text}
+        done.update(on_complete(full_text, answered) or {})
+        outcome = 'completed'
+        yield sse_event('done', done)
+    except GeneratorExit:
+        # Dropping the response without reading further releases the
+        # upstream stream; nothing is saved for a cancelled turn.
+        if outcome != 'completed':
+            outcome = 'cancelled'
+            print(f"Chat stream cancelled by client after {sum(len(p) for p in parts)} characters.")
+        raise
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        yield sse_event('error', {'response': describe_error(e, response)})
+    finally:
+        stats.record(outcome, ttft)
+        if ttft is not None:
+            print(f"Chat stream {outcome}: first token after {ttft * 1000:.0f} ms, "
+                  f"total {(time.perf_counter() - started) * 1000:.0f} ms.")
@@ -0,0 +1,173 @@
+"""Bulk crop recommendation for CSV / XLSX farm records.
+
+Input files have the same columns as ``Data/crop_prediction.xlsx``. They are
+read and scored in fixed-size chunks and the results are written out as CSV
+chunk by chunk, so memory stays bounded regardless of file size.
+
+Usage:
+    python crop_bulk.py farms.xlsx -o recommendations.csv --top-k 3
+"""
+import argparse
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+CROP_FEATURES = ['Location', 'Soil Type', 'Rainfall (mm)', 'Temperature (°C)', 'Humidity (%)', 'Season']
+CATEGORICAL_FEATURES = ['Location', 'Soil Type', 'Season']
+NUMERIC_FEATURES = ['Rainfall (mm)', 'Temperature (°C)', 'Humidity (%)']
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def iter_chunks(source, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrames of at most ``chunk_size`` rows from a CSV or XLSX file."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        # Hand pandas a text stream we own: if it wraps a binary upload
+        # itself, collecting that wrapper closes the upload mid-stream.
+        if not isinstance(source, io.TextIOBase):
+            source = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+        yield from pd.read_csv(source, chunksize=chunk_size)
+    elif name.endswith(('.xlsx', '.xlsm')):
+        yield from _iter_xlsx_chunks(source, chunk_size)
+    else:
+        raise ValueError("Unsupported file type. Upload a .csv or .xlsx file.")
+
+
+def _iter_xlsx_chunks(source, chunk_size):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c).strip() if c is not None else '' for c in header]
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+
+def validate_chunk(df):
+    """Normalise feature columns and return ``(features, error_messages)``.
+
+    Rows with a missing category or a non-numeric or infinite measurement
+    get an error message instead of a prediction. All checks are column-wise.
+    """
+    features = pd.DataFrame(index=df.index)
+    errors = pd.Series('', index=df.index, dtype=object)
+
+    for col in CATEGORICAL_FEATURES:
+        values = df[col].astype('string').str.strip()
+        bad = values.isna() | (values == '')
+        features[col] = values.fillna('').astype(object)
+        errors = errors.where(~bad, errors + f"missing {col}; ")
+
+    for col in NUMERIC_FEATURES:
+        values = pd.to_numeric(df[col], errors='coerce')
+        bad = values.isna()
+        features[col] = values
+        errors = errors.where(~bad, errors + f"invalid {col}; ")
+        infinite = ~bad & ~np.isfinite(values.astype(float))
+        errors = errors.where(~infinite, errors + f"non-finite {col}; ")
+
+    return features[CROP_FEATURES], errors.str.rstrip('; ')
+
+
+def predict_chunk(model, df, top_k=3):
+    missing = [col for col in CROP_FEATURES if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    features, errors = validate_chunk(df)
+    valid = (errors == '').to_numpy()
+
+    out = df.copy()
+    out['Predicted Crop'] = ''
+    out['Top Crops'] = ''
+    out['Error'] = errors.to_numpy()
+
+    if valid.any():
+        X = features[valid]
+        if top_k > 0 and hasattr(model, 'predict_proba'):
+            proba = model.predict_proba(X)
+            classes = np.asarray(model.classes_)
+            order = np.argsort(-proba, axis=1, kind='stable')[:, :top_k]
+            predicted = classes[order[:, 0]]
+            top = [
+                ', '.join(f"{classes[j]} ({p[j] * 100:.1f}%)" for j in idx)
+                for idx, p in zip(order, proba)
+            ]
+            out.loc[valid, 'Top Crops'] = top
+        else:
+            predicted = model.predict(X)
+        out.loc[valid, 'Predicted Crop'] = predicted
+    return out
+
+
+def _call(fn, *args):
+    return fn(*args)
+
+
+def stream_predictions(model, source, filename, chunk_size=DEFAULT_CHUNK_SIZE, top_k=3, run=None):
+    """Return a generator of CSV text for the scored file.
+
+    The first chunk is read and checked before returning, so a bad file
+    (wrong type, missing columns) raises ``ValueError`` up front instead of
+    halfway through a streamed response. ``run(fn, *args)``, if given, is
+    used to call ``predict_chunk`` (e.g. to move it onto an inference pool).
+    """
+    run = run or _call
+    chunks = iter_chunks(source, filename, chunk_size)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError("The uploaded file has no rows.")
+    first_out = run(predict_chunk, model, first, top_k)
+
+    def generate():
+        buffer = io.StringIO()
+        first_out.to_csv(buffer, index=False)
+        yield buffer.getvalue()
+        for chunk in chunks:
+            buffer = io.StringIO()
+            run(predict_chunk, model, chunk, top_k).to_csv(buffer, index=False, header=False)
+            yield buffer.getvalue()
+
+    return generate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk crop recommendations for CSV/XLSX farm records.")
+    parser.add_argument('input', help="CSV or XLSX file with the crop_prediction.xlsx columns")
+    parser.add_argument('-o', '--output', help="CSV file to write (default: stdout)")
+    parser.add_argument('--model', default=os.path.join(os.path.dirname(__file__), 'models', 'crop_prediction_model.pkl'))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--top-k', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    import joblib
+    model = joblib.load(args.model)
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        with open(args.input, 'rb') as source:
+            for text in stream_predictions(model, source, args.input, args.chunk_size, args.top_k):
+                out.write(text)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
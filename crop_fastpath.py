@@ -0,0 +1,242 @@
+"""Pandas-free inference for ``models/crop_prediction_model.pkl``.
+
+The fitted pipeline is StandardScaler + OneHotEncoder feeding a
+RandomForestClassifier. ``FastCropPredictor`` flattens that into plain NumPy:
+category -> column lookup tables, the scaler's mean/scale, and every tree's
+nodes packed into shared arrays so all trees are walked together, one
+vectorised step per tree level. Output matches ``pipeline.predict`` /
+``predict_proba`` exactly, including the float32 cast sklearn's trees use.
+
+Check equivalence (and latency) against the pipeline:
+    python crop_fastpath.py --verify Data/crop_prediction.xlsx
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+_FLOAT32_MAX = float(np.finfo(np.float32).max)
+
+
+class FastCropPredictor:
+
+    def __init__(self, pipeline):
+        preprocessor, classifier = self._unpack(pipeline)
+        self.feature_names = list(preprocessor.feature_names_in_)
+        self.classes_ = np.asarray(classifier.classes_)
+        self.n_features = int(classifier.n_features_in_)
+
+        self.numeric_features = []  # (input position, output column, mean, scale)
+        self.categorical_features = []  # (input position, {category: output column}, reject unknown)
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == 'remainder':
+                continue
+            out_cols = preprocessor.output_indices_[name]
+            positions = [self.feature_names.index(col) for col in columns]
+            if name == 'num':
+                mean = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+                for i, pos in enumerate(positions):
+                    self.numeric_features.append((pos, out_cols.start + i, mean[i], scale[i]))
+            else:
+                offset = out_cols.start
+                strict = transformer.handle_unknown == 'error'
+                for pos, categories in zip(positions, transformer.categories_):
+                    lookup = {cat: offset + j for j, cat in enumerate(categories)}
+                    self.categorical_features.append((pos, lookup, strict))
+                    offset += len(categories)
+
+        self._pack_trees(classifier.estimators_)
+        self._local = threading.local()
+
+    @staticmethod
+    def _unpack(pipeline):
+        steps = dict(pipeline.named_steps)
+        preprocessor = steps.get('preprocessor')
+        classifier = steps.get('classifier')
+        if preprocessor is None or classifier is None or not hasattr(classifier, 'estimators_'):
+            raise ValueError("Expected a Pipeline(preprocessor=ColumnTransformer, classifier=RandomForestClassifier).")
+        if classifier.n_outputs_ != 1:
+            raise ValueError("Multi-output forests are not supported.")
+        for name, transformer, _ in preprocessor.transformers_:
+            if name == 'remainder':
+                if transformer != 'drop':
+                    raise ValueError("Only remainder='drop' is supported.")
+            elif name == 'num':
+                if type(transformer).__name__ != 'StandardScaler':
+                    raise ValueError(f"Unsupported numeric transformer: {transformer!r}")
+            elif name == 'cat':
+                if type(transformer).__name__ != 'OneHotEncoder' or transformer.drop is not None \
+                        or getattr(transformer, 'infrequent_categories_', None) is not None:
+                    raise ValueError(f"Unsupported categorical transformer: {transformer!r}")
+            else:
+                raise ValueError(f"Unsupported transformer '{name}'.")
+        return preprocessor, classifier
+
+    def _pack_trees(self, estimators):
+        lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            n = tree.node_count
+            idx = np.arange(n)
+            leaf = tree.children_left == -1
+            # Leaves point at themselves so extra iterations are no-ops.
+            lefts.append(np.where(leaf, idx, tree.children_left) + offset)
+            rights.append(np.where(leaf, idx, tree.children_right) + offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # Same per-leaf normalisation as DecisionTreeClassifier.predict_proba.
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer[:, None])
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        self._children = np.stack([np.concatenate(lefts), np.concatenate(rights)], axis=1)
+        self._is_leaf = self._children[:, 0] == np.arange(offset)
+        self._feature = np.concatenate(features)
+        self._threshold = np.concatenate(thresholds)
+        self._value = np.concatenate(values)
+        self._roots = np.asarray(roots)
+        self._max_depth = max_depth
+
+    def _buffer(self):
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = np.zeros((1, self.n_features), dtype=np.float32)
+            self._local.buf = buf
+        return buf
+
+    def encode(self, rows, out=None):
+        """Encode rows (sequences in ``feature_names`` order) into float32 features."""
+        if out is None:
+            out = np.zeros((len(rows), self.n_features), dtype=np.float32)
+        else:
+            out.fill(0.0)
+        for r, row in enumerate(rows):
+            for pos, col, mean, scale in self.numeric_features:
+                # The tree walk would send NaN left and compare infinities,
+                # where the sklearn pipeline refuses them; do the same.
+                value = float(row[pos])
+                if value != value:
+                    raise ValueError("Input X contains NaN.")
+                scaled = (value - mean) / scale
+                if not abs(scaled) <= _FLOAT32_MAX:
+                    raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+                out[r, col] = scaled
+            for i, (pos, lookup, strict) in enumerate(self.categorical_features):
+                col = lookup.get(row[pos])
+                if col is not None:
+                    out[r, col] = 1.0
+                elif strict:
+                    # handle_unknown='error': sklearn refuses the row too.
+                    raise ValueError(f"Found unknown categories [{row[pos]!r}] in column {i} during transform")
+        return out
+
+    def predict_proba_encoded(self, X):
+        n = X.shape[0]
+        nodes = np.repeat(self._roots[:, None], n, axis=1)
+        samples = np.arange(n)
+        for depth in range(self._max_depth):
+            go_right = X[samples, self._feature[nodes]] > self._threshold[nodes]
+            nodes = self._children[nodes, go_right.view(np.int8)]
+            if depth % 8 == 7 and self._is_leaf[nodes].all():
+                break
+        # Summing trees in order along axis 0 matches the forest's accumulation.
+        proba = self._value[nodes].sum(axis=0)
+        proba /= len(self._roots)
+        return proba
+
+    def _leaves_one(self, x):
+        nodes = self._roots
+        for depth in range(self._max_depth):
+            nodes = self._children[nodes, (x[self._feature[nodes]] > self._threshold[nodes]).view(np.int8)]
+            if depth % 8 == 7 and self._is_leaf[nodes].all():
+                break
+        return nodes
+
+    def predict_proba(self, rows):
+        return self.predict_proba_encoded(self.encode(rows))
+
+    def predict(self, rows):
+        return self.classes_.take(np.argmax(self.predict_proba(rows), axis=1))
+
+    def predict_one(self, row):
+        x = self.encode([row], out=self._buffer())[0]
+        proba = self._value[self._leaves_one(x)].sum(axis=0)
+        proba /= len(self._roots)
+        return self.classes_[int(np.argmax(proba))]
+
+
+def verify(pipeline, df, predictor=None):
+    """Compare the fast path with ``pipeline`` on every row of ``df``."""
+    predictor = predictor or FastCropPredictor(pipeline)
+    X = df[predictor.feature_names]
+    rows = X.values.tolist()
+
+    expected_proba = pipeline.predict_proba(X)
+    expected = pipeline.predict(X)
+    fast_proba = predictor.predict_proba(rows)
+    fast = np.asarray([predictor.predict_one(row) for row in rows])
+
+    return {
+        'rows': len(rows),
+        'label_mismatches': int((fast != expected).sum()),
+        'proba_identical': bool(np.array_equal(fast_proba, expected_proba)),
+        'max_proba_diff': float(np.abs(fast_proba - expected_proba).max()) if len(rows) else 0.0,
+    }
+
+
+def benchmark(pipeline, df, predictor=None, repeat=200):
+    import pandas as pd
+
+    predictor = predictor or FastCropPredictor(pipeline)
+    row = df[predictor.feature_names].iloc[0].tolist()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        pipeline.predict(pd.DataFrame([row], columns=predictor.feature_names))
+    pipeline_ms = (time.perf_counter() - started) / repeat * 1000
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        predictor.predict_one(row)
+    fast_ms = (time.perf_counter() - started) / repeat * 1000
+    return {'pipeline_ms': pipeline_ms, 'fast_ms': fast_ms}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify and time the fast crop inference path.")
+    parser.add_argument('--verify', metavar='DATA', default=os.path.join(os.path.dirname(__file__), 'Data', 'crop_prediction.xlsx'))
+    parser.add_argument('--model', default=os.path.join(os.path.dirname(__file__), 'models', 'crop_prediction_model.pkl'))
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    import joblib
+    import pandas as pd
+
+    pipeline = joblib.load(args.model)
+    df = pd.read_csv(args.verify) if args.verify.lower().endswith('.csv') else pd.read_excel(args.verify)
+    predictor = FastCropPredictor(pipeline)
+
+    report = verify(pipeline, df, predictor)
+    print(f"Rows checked: {report['rows']}")
+    print(f"Label mismatches: {report['label_mismatches']}")
+    print(f"Probabilities identical: {report['proba_identical']} (max diff {report['max_proba_diff']:.3g})")
+
+    timings = benchmark(pipeline, df, predictor, args.repeat)
+    print(f"Pipeline predict: {timings['pipeline_ms']:.3f} ms/row")
+    print(f"Fast path predict: {timings['fast_ms']:.3f} ms/row")
+
+    if report['label_mismatches']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
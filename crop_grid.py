@@ -0,0 +1,216 @@
+"""Precomputed crop recommendations over a quantized input grid.
+
+Every known Location x Soil Type x Season combination is evaluated at evenly
+spaced rainfall / temperature / humidity points and the winning class index
+is stored in a uint8 array (``.npy``, loaded memory-mapped) with a JSON
+sidecar describing the axes. A lookup rounds each measurement to its nearest
+grid point, so answers are approximate; inputs outside the grid or with
+unknown categories return ``None`` and the caller falls back to the model.
+
+    python crop_grid.py build --out models/crop_grid.npy --rainfall 250:3000:250
+    python crop_grid.py report --grid models/crop_grid.npy
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from crop_fastpath import FastCropPredictor
+
+NUMERIC_AXES = ['Rainfall (mm)', 'Temperature (°C)', 'Humidity (%)']
+DEFAULT_AXES = {
+    'Rainfall (mm)': (250.0, 3000.0, 250.0),
+    'Temperature (°C)': (18.0, 36.0, 2.0),
+    'Humidity (%)': (40.0, 90.0, 5.0),
+}
+
+
+def parse_axis(text):
+    """Parse ``start:stop:step`` into a float triple."""
+    start, stop, step = (float(v) for v in text.split(':'))
+    if step <= 0 or stop < start:
+        raise ValueError(f"Invalid grid axis '{text}'")
+    return start, stop, step
+
+
+def _axis_points(start, stop, step):
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(count, dtype=np.float64)
+
+
+class CropGrid:
+
+    def __init__(self, grid, meta):
+        self.grid = grid
+        self.meta = meta
+        self.classes = np.asarray(meta['classes'], dtype=object)
+        self.categorical = [(pos, {cat: i for i, cat in enumerate(cats)}) for pos, cats in meta['categories']]
+        self.axes = [(pos, start, step, count) for pos, start, step, count in meta['axes']]
+
+    @classmethod
+    def load(cls, path):
+        with open(path + '.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(np.load(path, mmap_mode='r'), meta)
+
+    @property
+    def model_version(self):
+        return self.meta.get('model_version')
+
+    def lookup(self, row):
+        index = []
+        for pos, lookup in self.categorical:
+            i = lookup.get(row[pos])
+            if i is None:
+                return None
+            index.append(i)
+        for pos, start, step, count in self.axes:
+            q = (float(row[pos]) - start) / step
+            if not -0.5 <= q <= count - 0.5:
+                return None
+            index.append(min(int(q + 0.5), count - 1))
+        return self.classes[self.grid[tuple(index)]]
+
+
+def build(pipeline, axes=None, batch_rows=100000, model_version=None):
+    """Evaluate ``pipeline`` over the grid and return a ``CropGrid``."""
+    axes = {**DEFAULT_AXES, **(axes or {})}
+    predictor = FastCropPredictor(pipeline)
+    classifier = pipeline.named_steps['classifier']
+    if len(predictor.classes_) > 255:
+        raise ValueError("Too many classes for a uint8 grid.")
+
+    names = predictor.feature_names
+    cat_specs = [(pos, list(lookup.items())) for pos, lookup, _ in predictor.categorical_features]
+    num_specs = {pos: (col, mean, scale) for pos, col, mean, scale in predictor.numeric_features}
+    axis_specs = [(names.index(name), axes[name]) for name in NUMERIC_AXES]
+
+    # Scaled numeric features for every grid point, computed exactly as the
+    # fast path does for a single row so grid points match the live model.
+    points = np.meshgrid(*[_axis_points(*spec) for _, spec in axis_specs], indexing='ij')
+    n_numeric = points[0].size
+    numeric_block = np.zeros((n_numeric, predictor.n_features), dtype=np.float32)
+    for (pos, _), values in zip(axis_specs, points):
+        col, mean, scale = num_specs[pos]
+        numeric_block[:, col] = (values.ravel() - mean) / scale
+
+    cat_shape = [len(items) for _, items in cat_specs]
+    combos = np.stack(np.meshgrid(*[np.arange(n) for n in cat_shape], indexing='ij'), axis=-1).reshape(-1, len(cat_specs))
+    cat_columns = [np.asarray([col for _, col in items]) for _, items in cat_specs]
+
+    result = np.empty((len(combos), n_numeric), dtype=np.uint8)
+    per_batch = max(1, batch_rows // n_numeric)
+    for start in range(0, len(combos), per_batch):
+        chunk = combos[start:start + per_batch]
+        X = np.tile(numeric_block, (len(chunk), 1))
+        rows = np.arange(len(X))
+        for k, columns in enumerate(cat_columns):
+            X[rows, np.repeat(columns[chunk[:, k]], n_numeric)] = 1.0
+        proba = classifier.predict_proba(X)
+        result[start:start + len(chunk)] = np.argmax(proba, axis=1).reshape(len(chunk), n_numeric)
+
+    grid = result.reshape(cat_shape + list(points[0].shape))
+    meta = {
+        'classes': [str(c) for c in predictor.classes_],
+        'categories': [(pos, [str(cat) for cat, _ in items]) for pos, items in cat_specs],
+        'axes': [(pos, spec[0], spec[2], len(_axis_points(*spec))) for pos, spec in axis_specs],
+        'axis_ranges': {name: list(axes[name]) for name in NUMERIC_AXES},
+        'model_version': model_version,
+    }
+    return CropGrid(grid, meta)
+
+
+def save(crop_grid, path):
+    _replace_atomically(path, 'wb', lambda f: np.save(f, np.ascontiguousarray(crop_grid.grid)))
+    _replace_atomically(path + '.json', 'w', lambda f: json.dump(crop_grid.meta, f, indent=1))
+
+
+def _replace_atomically(path, mode, write):
+    # A unique temp file in the target directory, so concurrent writers never
+    # share a name and readers only ever see a complete file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+            write(f)
+        os.chmod(tmp, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def agreement(crop_grid, pipeline, df=None, samples=2000, seed=0):
+    """How often a grid lookup gives the same crop as the live model.
+
+    Measured on the rows of ``df`` (real farm records) and on ``samples``
+    random inputs drawn uniformly inside the grid.
+    """
+    predictor = FastCropPredictor(pipeline)
+    report = {}
+
+    if df is not None:
+        rows = df[predictor.feature_names].values.tolist()
+        looked_up = [crop_grid.lookup(row) for row in rows]
+        covered = [i for i, v in enumerate(looked_up) if v is not None]
+        live = predictor.predict([rows[i] for i in covered]) if covered else []
+        matches = sum(1 for i, pred in zip(covered, live) if looked_up[i] == pred)
+        report['dataset_rows'] = len(rows)
+        report['dataset_coverage'] = len(covered) / len(rows) if rows else 0.0
+        report['dataset_agreement'] = matches / len(covered) if covered else None
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(samples):
+        row = [None] * len(predictor.feature_names)
+        for pos, cats in crop_grid.meta['categories']:
+            row[pos] = cats[rng.integers(len(cats))]
+        for pos, start, step, count in crop_grid.axes:
+            row[pos] = float(rng.uniform(start, start + step * (count - 1)))
+        rows.append(row)
+    live = predictor.predict(rows)
+    matches = sum(1 for row, pred in zip(rows, live) if crop_grid.lookup(row) == pred)
+    report['random_samples'] = samples
+    report['random_agreement'] = matches / samples if samples else None
+    return report
+
+
+def main(argv=None):
+    here = os.path.dirname(__file__)
+    parser = argparse.ArgumentParser(description="Build or evaluate the precomputed crop lookup grid.")
+    parser.add_argument('command', choices=['build', 'report'])
+    parser.add_argument('--out', '--grid', dest='grid', default=os.path.join(here, 'models', 'crop_grid.npy'))
+    parser.add_argument('--model', default=os.path.join(here, 'models', 'crop_prediction_model.pkl'))
+    parser.add_argument('--data', default=os.path.join(here, 'Data', 'crop_prediction.xlsx'))
+    parser.add_argument('--rainfall', type=parse_axis, help="start:stop:step (default %s)" % ':'.join(map(str, DEFAULT_AXES['Rainfall (mm)'])))
+    parser.add_argument('--temperature', type=parse_axis, help="start:stop:step (default %s)" % ':'.join(map(str, DEFAULT_AXES['Temperature (°C)'])))
+    parser.add_argument('--humidity', type=parse_axis, help="start:stop:step (default %s)" % ':'.join(map(str, DEFAULT_AXES['Humidity (%)'])))
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    import joblib
+    import pandas as pd
+    from prediction_cache import model_fingerprint
+
+    pipeline = joblib.load(args.model)
+
+    if args.command == 'build':
+        axes = {name: value for name, value in zip(NUMERIC_AXES, (args.rainfall, args.temperature, args.humidity)) if value}
+        started = time.perf_counter()
+        crop_grid = build(pipeline, axes, model_version=model_fingerprint(args.model))
+        save(crop_grid, args.grid)
+        print(f"Built {crop_grid.grid.shape} grid ({crop_grid.grid.nbytes / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - started:.1f}s -> {args.grid}")
+    crop_grid = CropGrid.load(args.grid)
+
+    df = None
+    if args.data and os.path.exists(args.data):
+        df = pd.read_csv(args.data) if args.data.lower().endswith('.csv') else pd.read_excel(args.data)
+    report = agreement(crop_grid, pipeline, df, samples=args.samples)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Test-time augmentation and calibrated top-k output for the disease model.
+
+A handful of cheap views of the preprocessed image (flips, a centre crop,
+corner crops) are predicted together as one batch and their softmax
+outputs averaged. Confidences are temperature-scaled so that "80%" means
+roughly 80% on held-out photos; the temperature is fitted with
+
+    python disease_tta.py fit-temperature --samples DIR [--views ...]
+
+where DIR holds one sub-directory of images per label in disease_labels.
+"""
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+import image_pipeline
+
+VIEWS = ('identity', 'hflip', 'vflip', 'center_crop', 'top_left', 'bottom_right')
+DEFAULT_VIEWS = ('identity', 'hflip', 'vflip', 'center_crop')
+CROP_FRACTION = 0.875
+
+
+def parse_views(spec):
+    views = tuple(v.strip() for v in spec.split(',') if v.strip()) if isinstance(spec, str) else tuple(spec)
+    unknown = [v for v in views if v not in VIEWS]
+    if unknown or not views:
+        raise ValueError(f"Unknown TTA views {unknown}; choose from {', '.join(VIEWS)}")
+    return views
+
+
+def augment(array, views=DEFAULT_VIEWS, crop=CROP_FRACTION):
+    """Stack ``views`` of one HxWx3 model input into an (N, H, W, 3) batch."""
+    height, width = array.shape[:2]
+    batch = np.empty((len(views),) + array.shape, dtype=np.float32)
+    img = None
+    for i, view in enumerate(views):
+        if view == 'identity':
+            batch[i] = array
+        elif view == 'hflip':
+            batch[i] = array[:, ::-1]
+        elif view == 'vflip':
+            batch[i] = array[::-1]
+        else:
+            if img is None:
+                # Model inputs are uint8 / 255, so this round trip is lossless.
+                img = Image.fromarray(np.rint(array * 255.0).astype(np.uint8))
+            w, h = int(width * crop), int(height * crop)
+            x, y = {'center_crop': ((width - w) // 2, (height - h) // 2),
+                    'top_left': (0, 0),
+                    'bottom_right': (width - w, height - h)}[view]
+            resized = img.resize((width, height), Image.BILINEAR, box=(x, y, x + w, y + h))
+            np.divide(np.asarray(resized), np.float32(255.0), out=batch[i])
+    return batch
+
+
+def apply_temperature(probs, temperature):
+    """Rescale softmax outputs as if the logits had been divided by ``temperature``."""
+    probs = np.asarray(probs, dtype=np.float64)
+    if temperature == 1.0:
+        return probs
+    logits = np.log(np.clip(probs, 1e-12, 1.0)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=-1, keepdims=True)
+
+
+def combine(view_probs, temperature=1.0):
+    """Average the calibrated predictions of every view of one image."""
+    return apply_temperature(view_probs, temperature).mean(axis=0)
+
+
+def summarize(probs, labels, top_k=3, min_confidence=0.0, unknown_label='Unknown Disease'):
+    """Top-k labels with confidences in percent. Below ``min_confidence``
+    (percent) the answer becomes ``unknown_label``."""
+    order = np.argsort(probs)[::-1][:top_k]
+    top = [{'disease': labels[i] if i < len(labels) else unknown_label,
+            'confidence': round(float(probs[i]) * 100, 2)} for i in order]
+    uncertain = not top or top[0]['confidence'] < min_confidence
+    return {
+        'disease': unknown_label if uncertain else top[0]['disease'],
+        'confidence': top[0]['confidence'] if top else None,
+        'uncertain': uncertain,
+        'top_k': top,
+    }
+
+
+def combine_each(view_probs, temperature=1.0):
+    """``combine`` for every image of an (images, views, classes) array."""
+    return np.stack([combine(views, temperature) for views in view_probs])
+
+
+def fit_temperature(view_probs, targets, grid=None):
+    """Temperature minimising the negative log-likelihood of ``targets``.
+
+    ``view_probs`` holds every view's softmax output, (images, views,
+    classes), so each candidate is applied per view before averaging just
+    as ``combine`` does at serving time.
+    """
+    view_probs = np.asarray(view_probs, dtype=np.float64)
+    targets = np.asarray(targets)
+    grid = np.linspace(0.25, 5.0, 96) if grid is None else grid
+
+    def nll(t):
+        combined = combine_each(view_probs, t)
+        return -np.mean(np.log(np.clip(combined[np.arange(len(targets)), targets], 1e-12, 1.0)))
+
+    return float(min(grid, key=nll))
+
+
+def expected_calibration_error(probs, targets, bins=10):
+    probs = np.asarray(probs)
+    confidence = probs.max(axis=1)
+    correct = probs.argmax(axis=1) == np.asarray(targets)
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    error = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        mask = (confidence > lo) & (confidence <= hi)
+        if mask.any():
+            error += mask.mean() * abs(correct[mask].mean() - confidence[mask].mean())
+    return float(error)
+
+
+def _labelled_samples(sample_dir, labels, limit):
+    arrays, targets = [], []
+    for index, label in enumerate(labels):
+        folder = os.path.join(sample_dir, label)
+        if not os.path.isdir(folder):
+            continue
+        names = sorted(n for n in os.listdir(folder) if n.lower().endswith(('.jpg', '.jpeg', '.png')))[:limit]
+        for name in names:
+            with open(os.path.join(folder, name), 'rb') as f:
+                arrays.append(image_pipeline.load_into(f.read(), image_pipeline.input_buffer()).copy())
+            targets.append(index)
+    return arrays, targets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the disease model's confidence temperature.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('fit-temperature')
+    p.add_argument('--samples', required=True, help="Directory with one sub-directory of images per label.")
+    p.add_argument('--views', default=','.join(DEFAULT_VIEWS), help="TTA views, or 'identity' for single-pass.")
+    p.add_argument('--per-label', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('GEMINI_FAKE', '1')
+    import app
+
+    views = parse_views(args.views)
+    arrays, targets = _labelled_samples(args.samples, app.disease_labels, args.per_label)
+    if not arrays:
+        parser.error(f"No labelled images under {args.samples}")
+    model = app.model_registry.get('disease')
+    view_probs = np.stack([model.predict(augment(a, views), verbose=0) for a in arrays])
+    temperature = fit_temperature(view_probs, targets)
+    probs = combine_each(view_probs)
+    calibrated = combine_each(view_probs, temperature)
+    accuracy = float(np.mean(probs.argmax(axis=1) == np.asarray(targets)))
+    print(f"{len(arrays)} images, views={','.join(views)}, accuracy {accuracy:.1%}")
+    print(f"ECE before {expected_calibration_error(probs, targets):.3f}, "
+          f"after {expected_calibration_error(calibrated, targets):.3f}")
+    print(f"DISEASE_TEMPERATURE={temperature:.2f}")
+
+
+if __name__ == '__main__':
+    main()
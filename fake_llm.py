@@ -0,0 +1,99 @@
+"""Local stand-in for ``google.generativeai.GenerativeModel``.
+
+Implements just the surface app.py uses: ``start_chat(history=...)`` and
+``ChatSession.send_message(content, stream=..., safety_settings=...)``,
+with responses that expose ``.text`` and iterate as chunks when streamed.
+Latency is configurable, so chat routes, streaming and load tests can run
+offline. Enable in the app with ``GEMINI_FAKE=1``.
+"""
+import os
+import time
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.prompt_feedback = None
+        self.candidates = []
+
+
+class FakeResponse:
+
+    def __init__(self, chunks, first_token_delay, token_delay, stream, on_done=None):
+        self._chunks = chunks
+        self._first_token_delay = first_token_delay
+        self._token_delay = token_delay
+        self._stream = stream
+        self._on_done = on_done
+        self._consumed = False
+        self.prompt_feedback = None
+        self.candidates = []
+        if not stream:
+            self._sleep_full()
+
+    def _sleep_full(self):
+        time.sleep(self._first_token_delay + self._token_delay * max(0, len(self._chunks) - 1))
+        self._finish()
+
+    def _finish(self):
+        if not self._consumed:
+            self._consumed = True
+            if self._on_done:
+                self._on_done(self.text)
+
+    @property
+    def text(self):
+        return ''.join(self._chunks)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if self._stream:
+                time.sleep(self._first_token_delay if i == 0 else self._token_delay)
+            yield FakeChunk(chunk)
+        self._finish()
+
+    def resolve(self):
+        if self._stream and not self._consumed:
+            for _ in self:
+                pass
+
+
+class FakeChatSession:
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, safety_settings=None, **kwargs):
+        reply = self.model.reply_for(content, self.history)
+        words = reply.split(' ')
+        chunks = [w + (' ' if i < len(words) - 1 else '') for i, w in enumerate(words)]
+
+        def record(text):
+            self.history.append({'role': 'user', 'parts': [{'text': content}]})
+            self.history.append({'role': 'model', 'parts': [{'text': text}]})
+
+        return FakeResponse(chunks, self.model.first_token_delay, self.model.token_delay, stream, on_done=record)
+
+
+class FakeGenerativeModel:
+
+    def __init__(self, model_name='fake-gemini', first_token_ms=None, token_ms=None, reply=None):
+        if first_token_ms is None:
+            first_token_ms = float(os.getenv('GEMINI_FAKE_FIRST_TOKEN_MS', 200))
+        if token_ms is None:
+            token_ms = float(os.getenv('GEMINI_FAKE_TOKEN_MS', 20))
+        self.model_name = model_name
+        self.first_token_delay = first_token_ms / 1000.0
+        self.token_delay = token_ms / 1000.0
+        self.reply = reply
+
+    def reply_for(self, content, history):
+        if self.reply is not None:
+            return self.reply
+        turn = len(history) // 2 + 1
+        return (f"(offline assistant, turn {turn}) You asked: {content}. "
+                "Check soil moisture, inspect leaves regularly and consult your local extension officer.")
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
@@ -0,0 +1,60 @@
+import os
+
+# Chat requests spend most of their time waiting on Gemini. With gevent
+# workers each one is a greenlet, so a worker holds hundreds of open chats
+# while model inference runs in a bounded native thread pool (see
+# inference_pool.py). GUNICORN_WORKER_CLASS=gthread (or sync) switches back
+# to plain threads, e.g. where gevent is not installed.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+
+if worker_class == 'gevent':
+    try:
+        # Patch before app.py is preloaded so the locks, queues and sockets
+        # it creates at import are already cooperative.
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        print("gevent is not installed; falling back to gthread workers.")
+        worker_class = 'gthread'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+# MODEL_SERVER_SPAWN=1 runs model_server.py next to the master so every
+# worker shares one copy of the models (see model_server.py). The socket
+# path has to be in the environment before app.py is preloaded.
+MODEL_SERVER_SPAWN = os.getenv('MODEL_SERVER_SPAWN') == '1'
+if MODEL_SERVER_SPAWN:
+    os.environ.setdefault('MODEL_SERVER_SOCKET', '/tmp/farm_mitra_models.sock')
+
+_model_server = None
+
+
+def on_starting(server):
+    global _model_server
+    if not MODEL_SERVER_SPAWN:
+        return
+    import subprocess
+    import sys
+    import time
+
+    path = os.environ['MODEL_SERVER_SOCKET']
+    if os.path.exists(path):
+        os.unlink(path)
+    here = os.path.dirname(os.path.abspath(__file__))
+    _model_server = subprocess.Popen([sys.executable, os.path.join(here, 'model_server.py'), '--socket', path, '--preload'])
+    deadline = time.time() + 30
+    while not os.path.exists(path):
+        if _model_server.poll() is not None or time.time() > deadline:
+            raise RuntimeError("model_server.py did not start")
+        time.sleep(0.1)
+
+
+def on_exit(server):
+    if _model_server is not None:
+        _model_server.terminate()
+        _model_server.wait(timeout=30)
@@ -0,0 +1,59 @@
+import base64
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+
+MODEL_INPUT_SIZE = (128, 128)
+THUMBNAIL_SIZE = 256
+
+_buffers = threading.local()
+
+
+def open_image(stream, min_size=(THUMBNAIL_SIZE, THUMBNAIL_SIZE), draft=True):
+    """Decode an upload no larger than needed for ``min_size``.
+
+    For JPEGs, ``Image.draft`` lets libjpeg decode at 1/2, 1/4 or 1/8 scale
+    directly, so a 12 MP phone photo never materialises at full resolution.
+    """
+    img = Image.open(stream)
+    if draft and img.format == 'JPEG':
+        img.draft('RGB', min_size)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def input_buffer(size=MODEL_INPUT_SIZE):
+    """Per-thread float32 buffer for a single model input."""
+    shape = (size[1], size[0], 3)
+    buf = getattr(_buffers, 'array', None)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, dtype=np.float32)
+        _buffers.array = buf
+    return buf
+
+
+def to_model_input(img, size=MODEL_INPUT_SIZE, out=None):
+    """Resize once and scale to [0, 1] straight into ``out`` (float32, HxWx3)."""
+    if out is None:
+        out = np.empty((size[1], size[0], 3), dtype=np.float32)
+    resized = img.resize(size, Image.BICUBIC, reducing_gap=3.0)
+    np.divide(np.asarray(resized), np.float32(255.0), out=out)
+    return out
+
+
+def thumbnail_data_url(img, max_side=THUMBNAIL_SIZE, quality=75):
+    """Small JPEG preview as a data URL. Shrinks ``img`` in place."""
+    img.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=2.0)
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=quality)
+    return "data:image/jpeg;base64," + base64.b64encode(buffered.getvalue()).decode()
+
+
+def load_into(data, out, size=MODEL_INPUT_SIZE):
+    """Decode raw image bytes into a slot of a preallocated batch tensor."""
+    img = open_image(io.BytesIO(data), min_size=size)
+    to_model_input(img, size, out=out)
+    return out
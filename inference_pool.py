@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def gevent_active():
+    """True when gevent has monkey-patched threading (gevent gunicorn workers)."""
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+class InferencePool:
+    """Runs CPU-bound work (model inference, image decoding) in real OS threads.
+
+    Under gevent workers every ``threading.Thread`` is a greenlet, so a long
+    ``model.predict`` would freeze all other requests on that worker. There
+    the work goes to a gevent native thread pool and only the calling
+    greenlet waits. Under sync/gthread workers ``run`` calls the function
+    directly, with at most ``max_workers`` calls in progress at once.
+    """
+
+    def __init__(self, max_workers=2, name='inference'):
+        self.max_workers = max(1, int(max_workers))
+        self.name = name
+        self._semaphore = threading.BoundedSemaphore(self.max_workers)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _native_pool(self):
+        # Pools (and their threads) are per process, like the batcher worker.
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    if gevent_active():
+                        from gevent.threadpool import ThreadPool
+                        self._pool = ThreadPool(self.max_workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                    self._pool_pid = pid
+        return self._pool
+
+    def run(self, fn, *args):
+        if gevent_active():
+            return self._native_pool().apply(fn, args)
+        with self._semaphore:
+            return fn(*args)
+
+    def map(self, fn, iterable):
+        return list(self._native_pool().map(fn, iterable))
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'max_workers': self.max_workers,
+            'mode': 'gevent-threadpool' if gevent_active() else 'threads',
+        }
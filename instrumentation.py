@@ -0,0 +1,201 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """In-process counters, gauges and histograms in Prometheus text format.
+
+    Hot-path calls take one lock and do a few additions. Values that other
+    components already track (cache stats, model load times, batcher
+    stats) are pulled by collectors only when ``/metrics`` is scraped.
+    """
+
+    def __init__(self, prefix='farm_mitra', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help)
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        with self._lock:
+            self._gauges[(name, _labels_key(labels))] = value
+
+    def add_gauge(self, name, delta, labels=None):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, seconds, labels=None):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(self.buckets)] += 1
+            hist[-1] += seconds
+
+    @contextmanager
+    def stage(self, name, timings=None):
+        """Time a block as ``stage_seconds{stage=name}``. ``timings`` (a dict,
+        by default the current request's) also receives the milliseconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('stage_seconds', elapsed, {'stage': name})
+            if timings is None:
+                timings = current_timings()
+            if timings is not None:
+                timings[name] = round(timings.get(name, 0.0) + elapsed * 1000.0, 3)
+
+    def add_collector(self, collect):
+        """``collect()`` yields ``(kind, name, labels, value)`` at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+
+        collected = {}
+        for collect in self._collectors:
+            try:
+                for kind, name, labels, value in collect():
+                    if value is not None:
+                        collected.setdefault((kind, name), []).append((_labels_key(labels), value))
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+
+        series = {}
+        for (name, key), value in counters.items():
+            series.setdefault(('counter', name), []).append((key, value))
+        for (name, key), value in gauges.items():
+            series.setdefault(('gauge', name), []).append((key, value))
+        for kind_name, values in collected.items():
+            series.setdefault(kind_name, []).extend(values)
+
+        lines = []
+        for (kind, name), values in sorted(series.items(), key=lambda item: item[0][1]):
+            full = f"{self.prefix}_{name}"
+            self._header(lines, full, name, kind)
+            for key, value in sorted(values):
+                lines.append(f"{full}{_format_labels(key)} {float(value):g}")
+        for name in sorted({name for name, _ in histograms}):
+            full = f"{self.prefix}_{name}"
+            self._header(lines, full, name, 'histogram')
+            for (hist_name, key), hist in sorted(histograms.items()):
+                if hist_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, hist):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+                cumulative += hist[len(self.buckets)]
+                lines.append(f"{full}_bucket{_format_labels(key, [('le', '+Inf')])} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(key)} {hist[-1]:.6f}")
+                lines.append(f"{full}_count{_format_labels(key)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, full, name, kind):
+        _, help_text = self._meta.get(name, (kind, None))
+        if help_text:
+            lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+
+
+def current_timings():
+    """Stage timings (ms) of the request being handled, or None outside one."""
+    if not has_request_context():
+        return None
+    return g.setdefault('stage_timings', {})
+
+
+def init_app(app, metrics, log_requests=False):
+    """Request counts, latency and in-flight gauges for every route.
+
+    With ``log_requests`` each request also prints one JSON line with its
+    status, duration and stage timings.
+    """
+    metrics.describe('requests_total', 'counter', "HTTP requests by endpoint and status.")
+    metrics.describe('request_seconds', 'histogram', "Time to handle a request, including streamed bodies.")
+    metrics.describe('requests_in_flight', 'gauge', "Requests currently being handled.")
+    metrics.describe('stage_seconds', 'histogram', "Time spent in one stage of a request.")
+
+    @app.before_request
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+        g.metrics_endpoint = request.endpoint or 'unmatched'
+        g.stage_timings = {}
+        metrics.add_gauge('requests_in_flight', 1, {'endpoint': g.metrics_endpoint})
+
+    def finish(started, endpoint, method, path, status, timings, exc=None):
+        elapsed = time.perf_counter() - started
+        metrics.add_gauge('requests_in_flight', -1, {'endpoint': endpoint})
+        metrics.inc('requests_total', {'endpoint': endpoint, 'method': method, 'status': status})
+        metrics.observe('request_seconds', elapsed, {'endpoint': endpoint})
+        if log_requests:
+            print(json.dumps({
+                'ts': round(time.time(), 3),
+                'method': method,
+                'path': path,
+                'endpoint': endpoint,
+                'status': status,
+                'duration_ms': round(elapsed * 1000.0, 3),
+                'stages': timings,
+                'error': str(exc) if exc else None,
+            }), flush=True)
+
+    @app.after_request
+    def _finish_on_close(response):
+        # Streamed bodies (SSE chat, bulk CSV) are still being produced
+        # after this hook, so the request is counted once the server
+        # closes the response instead.
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            args = (started, g.metrics_endpoint, request.method, request.path, response.status_code, g.stage_timings)
+            response.call_on_close(lambda: finish(*args))
+        return response
+
+    @app.teardown_request
+    def _finish_failed(exc):
+        # Only reached with a start time left when after_request never ran.
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            finish(started, g.metrics_endpoint, request.method, request.path, 500, g.stage_timings, exc)
@@ -0,0 +1,403 @@
+"""Background jobs for uploads and analyses too slow for one request.
+
+Job rows live in a SQLite file shared by every gunicorn worker on the box;
+uploaded inputs and large results are plain files next to it. Each process
+runs a few worker threads (greenlets under gevent; the heavy parts already
+hop to the inference pools) that claim queued jobs one at a time, so total
+concurrency is ``processes x workers`` no matter how many jobs are waiting.
+
+Submitting the same input twice returns the existing job instead of
+running it again, and ``submit`` raises ``QueueFull`` once ``max_pending``
+jobs are queued or running so callers can answer 429. Jobs sharing a
+``serial_key`` (e.g. one chat) run one at a time, in submission order.
+
+A claimed job carries a lease token and a heartbeat keeps its ``updated``
+time fresh while it runs. If the heartbeat stops for ``stale_after``
+seconds the job is requeued under a new lease, and the old worker's
+progress and result writes no longer match any row.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+FINISHED = (DONE, FAILED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobError(Exception):
+    """Raised by a handler for a failure that should be reported as-is."""
+
+
+# SQLite's own busy handler sleeps inside the C call, which under gevent
+# blocks every greenlet on the worker. Keep it short and wait out a held
+# write lock with time.sleep instead, which yields.
+BUSY_TIMEOUT = 0.01
+BUSY_WAIT = 10.0
+
+
+def _execute(conn, sql, params=()):
+    deadline = time.monotonic() + BUSY_WAIT
+    delay = 0.005
+    while True:
+        try:
+            return conn.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            message = str(e)
+            if ('locked' not in message and 'busy' not in message) or time.monotonic() > deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+def input_hash(kind, params, payload_path=None):
+    digest = hashlib.sha256(kind.encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    if payload_path is not None:
+        with open(payload_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class Job:
+    """What a handler sees: its parameters, input file and progress hook."""
+
+    def __init__(self, queue, row):
+        self.queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = json.loads(row['params'])
+        self.lease = row['lease']
+        self.payload_path = queue.file_path(self.id, 'in') if row['has_payload'] else None
+
+    def read_payload(self):
+        with open(self.payload_path, 'rb') as f:
+            return f.read()
+
+    def result_path(self, suffix):
+        return self.queue.file_path(self.id, suffix)
+
+    def progress(self, done, total=None):
+        # Stops an attempt whose job was requeued before it writes any more.
+        if not self.queue._update(self, progress=json.dumps({'done': done, 'total': total})):
+            raise JobError(f"Job {self.id} was handed to another worker.")
+
+
+class JobQueue:
+
+    def __init__(self, directory, workers=2, max_pending=100, ttl=86400, stale_after=600,
+                 max_attempts=3, poll_interval=1.0):
+        self.directory = directory
+        self.path = os.path.join(directory, 'jobs.sqlite3')
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = float(ttl)
+        self.stale_after = float(stale_after)
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._started_pid = None
+        self._last_maintenance = 0.0
+        self._start_lock = threading.Lock()
+        self._counts = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        self._counts_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def register(self, kind, handler):
+        """``handler(job)`` returns a JSON-serialisable result."""
+        self.handlers[kind] = handler
+
+    def file_path(self, job_id, suffix):
+        return os.path.join(self.directory, f"{job_id}.{suffix}")
+
+    def _connection(self):
+        # Same per-thread, per-process connections as SQLiteChatStore.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            _execute(conn, "PRAGMA journal_mode=WAL")
+            _execute(
+                conn,
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, input_hash TEXT NOT NULL, params TEXT NOT NULL, "
+                "has_payload INTEGER NOT NULL, status TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, started REAL, finished REAL, "
+                "updated REAL NOT NULL, lease TEXT, serial TEXT)"
+            )
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ('lease', 'serial'):
+                if column not in columns:
+                    _execute(conn, f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            _execute(conn, "CREATE INDEX IF NOT EXISTS jobs_hash ON jobs (input_hash)")
+            _execute(conn, "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            _execute(conn, "CREATE INDEX IF NOT EXISTS jobs_serial ON jobs (serial, status)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._connection())
+
+    # --- Submitting and reading ---
+
+    def submit(self, kind, params, payload=None, dedupe_key=None, serial_key=None):
+        """Queue a job and return ``(job_id, deduplicated)``.
+
+        ``payload`` is bytes, or a ``write(f)`` callable that streams it into
+        a binary file so large inputs never sit in memory; anything it raises
+        propagates and nothing is queued. ``dedupe_key`` (any JSON value) is
+        hashed with the kind, params and payload; pass whatever else decides
+        the answer, e.g. a model version. A job is not claimed while another
+        with the same ``serial_key`` is running.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        # The payload is written before taking the write lock, so a large
+        # upload never holds up other submitters or workers; inside the
+        # transaction it is only renamed into place.
+        staged = placed = None
+        if payload is not None:
+            fd, staged = tempfile.mkstemp(dir=self.directory, prefix='upload.', suffix='.tmp')
+        try:
+            if payload is not None:
+                with os.fdopen(fd, 'wb') as f:
+                    if callable(payload):
+                        payload(f)
+                    else:
+                        f.write(payload)
+            digest = input_hash(kind, {'params': params, 'key': dedupe_key}, staged)
+            now = time.time()
+            with self._transaction() as conn:
+                existing = conn.execute(
+                    "SELECT id FROM jobs WHERE input_hash = ? AND status != ? AND created > ? "
+                    "ORDER BY created DESC LIMIT 1",
+                    (digest, FAILED, now - self.ttl),
+                ).fetchone()
+                if existing is not None:
+                    self._count('deduplicated')
+                    return existing['id'], True
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+                if pending >= self.max_pending:
+                    self._count('rejected')
+                    raise QueueFull(f"{pending} jobs are already waiting; try again shortly.")
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, input_hash, params, has_payload, status, created, updated, serial) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, digest, json.dumps(params), int(payload is not None), QUEUED, now, now, serial_key),
+                )
+                if staged is not None:
+                    placed = self.file_path(job_id, 'in')
+                    os.replace(staged, placed)
+                    staged = None
+            placed = None  # committed: the job owns the file now
+        finally:
+            for leftover in (staged, placed):
+                if leftover is not None and os.path.exists(leftover):
+                    os.unlink(leftover)
+        self._count('submitted')
+        self.start()
+        self._wakeup.set()
+        return job_id, False
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'created': row['created'],
+            'started': row['started'],
+            'finished': row['finished'],
+            'attempts': row['attempts'],
+        }
+        if row['progress']:
+            job['progress'] = json.loads(row['progress'])
+        if row['status'] == QUEUED:
+            job['position'] = self._connection().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, row['created'])
+            ).fetchone()[0]
+        if row['status'] == DONE:
+            job['result'] = json.loads(row['result'])
+        if row['status'] == FAILED:
+            job['error'] = row['error']
+        return job
+
+    def stats(self):
+        try:
+            counts = dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        except sqlite3.Error:
+            counts = {}
+        with self._counts_lock:
+            totals = dict(self._counts)
+        return {'path': self.path, 'workers': self.workers, 'max_pending': self.max_pending,
+                'jobs': counts, **totals}
+
+    def _count(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    # --- Workers ---
+
+    def start(self):
+        """Start this process's workers (once per process, after any fork)."""
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._wakeup = threading.Event()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _claim(self):
+        now = time.time()
+        if now - self._last_maintenance > 60:
+            self._last_maintenance = now
+            self._maintain(now)
+        conn = self._connection()
+        # A plain read first, so idle workers never take the write lock.
+        if conn.execute(_NEXT_JOB, (QUEUED, RUNNING)).fetchone() is None:
+            return None
+        with self._transaction() as conn:
+            row = conn.execute(_NEXT_JOB, (QUEUED, RUNNING)).fetchone()
+            if row is None:
+                return None
+            lease = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease = ?, started = ?, updated = ?, attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, lease, now, now, row['id']),
+            )
+        return Job(self, {**dict(row), 'lease': lease})
+
+    def _run(self, job):
+        handler = self.handlers.get(job.kind)
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job, stop), name=f'job-heartbeat-{job.id}', daemon=True).start()
+        try:
+            if handler is None:
+                raise JobError(f"No handler for job kind '{job.kind}'")
+            result = handler(job)
+        except Exception as e:
+            if not isinstance(e, JobError):
+                print(f"Job {job.id} ({job.kind}) failed: {e}")
+            if self._finish(job, FAILED, error=str(e)):
+                self._count('failed')
+            return
+        finally:
+            stop.set()
+        if self._finish(job, DONE, result=json.dumps(result)):
+            self._count('completed')
+
+    def _heartbeat(self, job, stop):
+        interval = max(self.stale_after / 3, 0.1)
+        while not stop.wait(interval):
+            try:
+                if not self._update(job):
+                    return
+            except sqlite3.Error as e:
+                print(f"Job {job.id} heartbeat failed: {e}")
+
+    def _finish(self, job, status, result=None, error=None):
+        """Record the outcome; False if the job was requeued under another lease."""
+        now = time.time()
+        cursor = _execute(
+            self._connection(),
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, updated = ?, lease = NULL "
+            "WHERE id = ? AND lease = ? AND status = ?",
+            (status, result, error, now, now, job.id, job.lease, RUNNING),
+        )
+        self._wakeup.set()  # a job waiting on this one's serial_key may be next
+        if cursor.rowcount != 1:
+            print(f"Job {job.id} ({job.kind}) lost its lease; dropping this attempt's {status} result.")
+            return False
+        payload = self.file_path(job.id, 'in')
+        if os.path.exists(payload):
+            os.unlink(payload)
+        return True
+
+    def _update(self, job, **fields):
+        """Touch a running job (and set ``fields``) while ``job`` still holds its lease."""
+        fields['updated'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        cursor = _execute(
+            self._connection(),
+            f"UPDATE jobs SET {columns} WHERE id = ? AND lease = ? AND status = ?",
+            (*fields.values(), job.id, job.lease, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def _maintain(self, now):
+        stale = now - self.stale_after
+        with self._transaction() as conn:
+            # A running job whose heartbeat stopped for stale_after seconds
+            # lost its worker (process restarted or killed); retry it. Clearing
+            # the lease fences off that worker if it is merely stuck.
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease = NULL, updated = ? WHERE status = ? AND updated < ? AND attempts < ?",
+                (QUEUED, now, RUNNING, stale, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease = NULL, error = ?, finished = ?, updated = ? "
+                "WHERE status = ? AND updated < ?",
+                (FAILED, "The worker stopped while running this job.", now, now, RUNNING, stale),
+            )
+            expired = [row['id'] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND created <= ?", (DONE, FAILED, now - self.ttl))]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        if expired:
+            prefixes = tuple(f"{job_id}." for job_id in expired)
+            for name in os.listdir(self.directory):
+                if name.startswith(prefixes):
+                    os.unlink(os.path.join(self.directory, name))
+
+
+# The oldest queued job whose serial_key (if any) has nothing running.
+_NEXT_JOB = (
+    "SELECT * FROM jobs AS j WHERE status = ? AND (serial IS NULL OR NOT EXISTS "
+    "(SELECT 1 FROM jobs AS r WHERE r.serial = j.serial AND r.status = ?)) ORDER BY created LIMIT 1"
+)
+
+
+class _ImmediateTransaction:
+    # Claiming and deduplicating must see and change the table atomically
+    # across processes.
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        _execute(self.conn, "BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        _execute(self.conn, "ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+from prediction_cache import model_fingerprint
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def load_joblib(path):
+    import joblib
+    return joblib.load(path)
+
+
+def load_keras(path):
+    from tensorflow.keras.models import load_model
+    return load_model(path)
+
+
+def disease_model_path(models_dir, backend='keras'):
+    """The disease model file for ``DISEASE_MODEL_BACKEND``. The web app and
+    the model server both use this, so a proxy is registered (and versioned)
+    under the same file the server loads."""
+    if backend == 'tflite':
+        return os.getenv('DISEASE_TFLITE_PATH') or os.path.join(models_dir, 'plant_disease_model.tflite')
+    return os.path.join(models_dir, 'plant_disease_model.h5')
+
+
+class _ModelSpec:
+    def __init__(self, name, loader, path=None):
+        self.name = name
+        self.loader = loader
+        self.path = path
+        self.model = None
+        self.loaded = False
+        self.error = None
+        self.version = None
+        self.load_seconds = None
+        self.rss_delta = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Loads each model (and the framework it needs) on first use.
+
+    Nothing heavy is imported until ``get`` or ``preload`` is called, so
+    routes that never touch a model never pay for TensorFlow. Calling
+    ``preload`` before gunicorn forks lets workers share the loaded pages
+    copy-on-write. A failure only affects the model that failed.
+    """
+
+    def __init__(self):
+        self._specs = {}
+
+    def register(self, name, loader, path=None):
+        self._specs[name] = _ModelSpec(name, loader, path)
+
+    def names(self):
+        return list(self._specs)
+
+    def get(self, name):
+        spec = self._specs[name]
+        if spec.loaded:
+            return spec.model
+        with spec.lock:
+            if not spec.loaded:
+                self._load(spec)
+        return spec.model
+
+    def version(self, name):
+        spec = self._specs[name]
+        if spec.version is None and spec.path:
+            spec.version = model_fingerprint(spec.path)
+        return spec.version
+
+    def is_loaded(self, name):
+        spec = self._specs[name]
+        return spec.loaded and spec.model is not None
+
+    def preload(self, names=None):
+        for name in names or self.names():
+            if name not in self._specs:
+                print(f"Unknown model '{name}' requested for preload.")
+                continue
+            self.get(name)
+
+    def status(self):
+        report = {}
+        for name, spec in self._specs.items():
+            report[name] = {
+                'path': spec.path,
+                'loaded': spec.loaded and spec.model is not None,
+                'version': spec.version,
+                'load_seconds': round(spec.load_seconds, 3) if spec.load_seconds is not None else None,
+                'rss_delta_mb': round(spec.rss_delta / (1024 * 1024), 1) if spec.rss_delta is not None else None,
+                'error': spec.error,
+            }
+        return report
+
+    def _load(self, spec):
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        try:
+            if spec.path:
+                spec.model = spec.loader(spec.path)
+                spec.version = model_fingerprint(spec.path)
+            else:
+                spec.model = spec.loader()
+            spec.error = None
+        except Exception as e:
+            spec.model = None
+            spec.error = str(e)
+            print(f"Error loading model '{spec.name}': {e}")
+        spec.load_seconds = time.perf_counter() - started
+        spec.rss_delta = current_rss_bytes() - rss_before
+        spec.loaded = True
+        if spec.model is not None:
+            print(f"Model '{spec.name}' loaded in {spec.load_seconds:.2f}s "
+                  f"(+{spec.rss_delta / (1024 * 1024):.1f} MB RSS)"
+                  + (f" from {spec.path}" if spec.path else ""))
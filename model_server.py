@@ -0,0 +1,361 @@
+"""Local model server shared by all gunicorn workers on a box.
+
+One process loads the disease and crop models; web workers talk to it over
+a Unix socket with length-prefixed JSON messages. Image batches are not
+serialised: the client copies them into a shared-memory segment and only
+sends its name, shape and dtype. Single-image requests from different
+workers are merged by a ``BatchingPredictor`` before the forward pass.
+
+    python model_server.py --socket /tmp/farm_mitra_models.sock --preload
+
+and start the web app with ``MODEL_SERVER_SOCKET`` set to the same path
+(gunicorn.conf.py can also start the server, see ``MODEL_SERVER_SPAWN``).
+"""
+import argparse
+import atexit
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from gevent.monkey import get_original
+    _get_ident = get_original('_thread', 'get_ident')
+except ImportError:
+    from _thread import get_ident as _get_ident
+
+from batching import BatchingPredictor
+from model_registry import ModelRegistry, disease_model_path, load_joblib, load_keras
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+DEFAULT_SOCKET = '/tmp/farm_mitra_models.sock'
+_HEADER = struct.Struct('>I')
+
+
+class ModelServerError(RuntimeError):
+    pass
+
+
+def send_message(sock, message):
+    payload = json.dumps(message).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if payload is None:
+        raise ConnectionError("Model server connection closed mid-message")
+    return json.loads(payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every attach with the resource tracker,
+        # which would unlink the client's segment when this process exits.
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+# --- Server ---
+
+def build_registry():
+    registry = ModelRegistry()
+    registry.register('crop', load_joblib, os.path.join(MODELS_DIR, 'crop_prediction_model.pkl'))
+    backend = os.getenv('DISEASE_MODEL_BACKEND', 'keras')
+    if backend == 'tflite':
+        from tflite_backend import load_tflite
+        registry.register('disease', load_tflite, disease_model_path(MODELS_DIR, backend))
+    else:
+        registry.register('disease', load_keras, disease_model_path(MODELS_DIR, backend))
+
+    def load_crop_fastpath():
+        from crop_fastpath import FastCropPredictor
+        return FastCropPredictor(registry.get('crop'))
+
+    registry.register('crop_fast', load_crop_fastpath)
+    return registry
+
+
+class ModelService:
+
+    def __init__(self, registry=None):
+        self.registry = registry or build_registry()
+        self.disease_batcher = BatchingPredictor(
+            lambda batch: self._model('disease').predict(batch, verbose=0),
+            max_batch_size=int(os.getenv('DISEASE_BATCH_MAX_SIZE', 16)),
+            max_wait_ms=float(os.getenv('DISEASE_BATCH_MAX_WAIT_MS', 5)),
+            name='model_server_disease',
+        )
+
+    def _model(self, name):
+        model = self.registry.get(name)
+        if model is None:
+            raise ModelServerError(f"Model '{name}' is not available on the model server.")
+        return model
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'disease':
+            return {'predictions': self.predict_disease(request).tolist()}
+        if op == 'crop_predict':
+            return {'predictions': [str(p) for p in self._crop_predictor().predict(request['rows'])]}
+        if op == 'crop_proba':
+            return {'proba': np.asarray(self._crop_predictor().predict_proba(request['rows'])).tolist()}
+        if op == 'crop_info':
+            return {'classes': [str(c) for c in self._model('crop').classes_]}
+        if op == 'status':
+            return {'models': self.registry.status(), 'disease_batcher': self.disease_batcher.stats()}
+        raise ModelServerError(f"Unknown operation '{op}'")
+
+    def _crop_predictor(self):
+        return self.registry.get('crop_fast') or _PipelineRows(self._model('crop'))
+
+    def predict_disease(self, request):
+        self._model('disease')
+        shm = _attach_shared_memory(request['shm'])
+        batch = None
+        try:
+            batch = np.ndarray(request['shape'], dtype=request['dtype'], buffer=shm.buf)
+            if len(batch) == 1:
+                return self.disease_batcher.predict(batch[0].copy())[None, ...]
+            return self.disease_batcher.predict_many(batch)
+        finally:
+            del batch  # the view must go before the segment can be closed
+            shm.close()
+
+
+class _PipelineRows:
+    # Fallback when the fast path cannot be built for this pipeline.
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def _frame(self, rows):
+        import pandas as pd
+        return pd.DataFrame(rows, columns=list(self.pipeline.feature_names_in_))
+
+    def predict(self, rows):
+        return self.pipeline.predict(self._frame(rows))
+
+    def predict_proba(self, rows):
+        return self.pipeline.predict_proba(self._frame(rows))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, ValueError):
+                return
+            if request is None:
+                return
+            try:
+                response = self.server.service.handle(request)
+            except Exception as e:
+                print(f"Model server error ({request.get('op')}): {e}")
+                response = {'error': str(e)}
+            send_message(self.request, response)
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.service = service
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+
+def serve(path=DEFAULT_SOCKET, preload=False):
+    service = ModelService()
+    server = ModelServer(path, service)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Model server listening on {path}")
+    if preload:
+        threading.Thread(target=service.registry.preload, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# --- Client ---
+
+class _Channel:
+    def __init__(self, path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.shm = None
+
+    def buffer(self, nbytes):
+        if self.shm is None or self.shm.size < nbytes:
+            self.release_shm()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1 << 20))
+        return self.shm
+
+    def release_shm(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.release_shm()
+        self.sock.close()
+
+
+class ModelServerClient:
+    """Pool of connections (each with its own shared-memory segment) to a
+    ``ModelServer``, kept per OS thread: under gevent a socket belongs to
+    the hub of the thread that made it, so a channel is only ever reused by
+    the thread (e.g. the inference pool thread) that opened it. The pools
+    are rebuilt after a fork."""
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=120):
+        self.path = path
+        self.timeout = timeout
+        self._idle = {}  # OS thread id -> LifoQueue of idle channels
+        self._pid = os.getpid()
+        self._channels = []
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _pool(self):
+        thread_id = _get_ident()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Channels inherited from the parent process are not ours to use.
+                self._idle = {}
+                self._channels = []
+                self._pid = os.getpid()
+            pool = self._idle.get(thread_id)
+            if pool is None:
+                pool = self._idle[thread_id] = queue.LifoQueue()
+            return pool
+
+    def _acquire(self, pool):
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            channel = _Channel(self.path, self.timeout)
+            with self._lock:
+                self._channels.append(channel)
+            return channel
+
+    def _discard(self, channel):
+        with self._lock:
+            if channel in self._channels:
+                self._channels.remove(channel)
+        channel.close()
+
+    def call(self, request, tensor=None):
+        pool = self._pool()
+        channel = self._acquire(pool)
+        try:
+            if tensor is not None:
+                tensor = np.ascontiguousarray(tensor)
+                shm = channel.buffer(tensor.nbytes)
+                np.ndarray(tensor.shape, dtype=tensor.dtype, buffer=shm.buf)[...] = tensor
+                request = dict(request, shm=shm.name, shape=list(tensor.shape), dtype=str(tensor.dtype))
+            send_message(channel.sock, request)
+            response = recv_message(channel.sock)
+            if response is None:
+                raise ConnectionError("Model server closed the connection")
+        except Exception:
+            self._discard(channel)
+            raise
+        pool.put(channel)
+        if 'error' in response:
+            raise ModelServerError(response['error'])
+        return response
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            channels, self._channels = self._channels, []
+        for channel in channels:
+            channel.close()
+
+
+class RemoteDiseaseModel:
+    """Stands in for the Keras model: ``predict(batch, verbose=0)``."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def predict(self, batch, verbose=0):
+        response = self.client.call({'op': 'disease'}, tensor=np.asarray(batch, dtype=np.float32))
+        return np.asarray(response['predictions'], dtype=np.float32)
+
+
+class RemoteCropModel:
+    """Stands in for both the crop pipeline and ``FastCropPredictor``."""
+
+    def __init__(self, client):
+        self.client = client
+        self._classes = None
+
+    @property
+    def classes_(self):
+        if self._classes is None:
+            self._classes = np.asarray(self.client.call({'op': 'crop_info'})['classes'], dtype=object)
+        return self._classes
+
+    @staticmethod
+    def _rows(X):
+        return X.values.tolist() if hasattr(X, 'values') else [list(row) for row in X]
+
+    def predict(self, X):
+        return np.asarray(self.client.call({'op': 'crop_predict', 'rows': self._rows(X)})['predictions'], dtype=object)
+
+    def predict_proba(self, X):
+        return np.asarray(self.client.call({'op': 'crop_proba', 'rows': self._rows(X)})['proba'])
+
+    def predict_one(self, row):
+        return self.predict([row])[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the disease and crop models over a Unix socket.")
+    parser.add_argument('--socket', default=os.getenv('MODEL_SERVER_SOCKET') or DEFAULT_SOCKET)
+    parser.add_argument('--preload', action='store_true', help="Load every model at startup.")
+    args = parser.parse_args(argv)
+    serve(args.socket, args.preload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def model_fingerprint(path):
+    """Identifies the exact model file a prediction came from."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 'missing'
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def make_key(namespace, version, payload):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    digest = hashlib.sha256(payload).hexdigest()
+    return f"{namespace}:{version}:{digest}"
+
+
+class PredictionCache:
+    """LRU + TTL cache for model outputs, optionally backed by SQLite.
+
+    The in-memory layer is per process. When ``path`` is set, entries are
+    also written to a SQLite file so every gunicorn worker on the box shares
+    hits. Values must be JSON-serialisable.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, path=None):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self.path = path
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._disk_get(key, now) if self.path else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+        self._remember(key, value, now)
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        self._remember(key, value, now)
+        if self.path:
+            self._disk_set(key, value, now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    conn.execute("DELETE FROM predictions")
+            except sqlite3.Error as e:
+                print(f"Prediction cache clear error: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'shared': bool(self.path),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def _remember(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _connection(self):
+        # sqlite3 connections cannot cross threads or forks; open one per
+        # thread lazily so nothing created before a gunicorn fork is reused.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key, now):
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM predictions WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE predictions SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Prediction cache read error: {e}")
+            return None
+
+    def _disk_set(self, key, value, now):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now + self.ttl, now),
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._disk_evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"Prediction cache write error: {e}")
+
+    def _disk_evict(self, conn, now):
+        conn.execute("DELETE FROM predictions WHERE expires <= ?", (now,))
+        conn.execute(
+            "DELETE FROM predictions WHERE key IN ("
+            "SELECT key FROM predictions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
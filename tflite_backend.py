@@ -0,0 +1,251 @@
+"""TFLite runtime for the plant disease model.
+
+Export the Keras model once (needs full TensorFlow):
+
+    python tflite_backend.py export --quantization float16 --samples static/uploads
+
+then run the app with ``DISEASE_MODEL_BACKEND=tflite``. Inference uses the
+first interpreter that can be imported, in order: ``tflite_runtime``,
+``ai_edge_litert``, ``tensorflow.lite``. The first two are small packages,
+so the serving process never imports full TensorFlow.
+
+Check top-1 agreement, latency and memory against the Keras model:
+
+    python tflite_backend.py compare --samples static/uploads
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import image_pipeline
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+DEFAULT_KERAS_PATH = os.path.join(MODELS_DIR, 'plant_disease_model.h5')
+DEFAULT_TFLITE_PATH = os.path.join(MODELS_DIR, 'plant_disease_model.tflite')
+QUANTIZATIONS = ('float16', 'int8', 'dynamic', 'none')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """Keras-compatible ``predict`` on top of a TFLite interpreter.
+
+    Interpreters are not thread-safe, so each thread gets its own, resized
+    on demand to the incoming batch size. Quantized input and output
+    tensors are converted from and to float32 probabilities.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self.num_threads = num_threads
+        with open(path, 'rb') as f:
+            self._content = f.read()
+        self._interpreter_class = interpreter_class()
+        self._local = threading.local()
+        self._interpreter()  # fail at load time, not on the first request
+
+    def _interpreter(self):
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_content=self._content, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.batch_size = int(interpreter.get_input_details()[0]['shape'][0])
+        return interpreter
+
+    def predict(self, batch, verbose=0):
+        interpreter = self._interpreter()
+        batch = np.asarray(batch, dtype=np.float32)
+        input_detail = interpreter.get_input_details()[0]
+        if self._local.batch_size != len(batch):
+            interpreter.resize_tensor_input(input_detail['index'], [len(batch), *batch.shape[1:]])
+            interpreter.allocate_tensors()
+            self._local.batch_size = len(batch)
+            input_detail = interpreter.get_input_details()[0]
+
+        scale, zero_point = input_detail['quantization']
+        if input_detail['dtype'] != np.float32:
+            batch = np.round(batch / scale + zero_point).astype(input_detail['dtype'])
+        interpreter.set_tensor(input_detail['index'], batch)
+        interpreter.invoke()
+
+        output_detail = interpreter.get_output_details()[0]
+        output = interpreter.get_tensor(output_detail['index'])
+        if output_detail['dtype'] != np.float32:
+            scale, zero_point = output_detail['quantization']
+            return (output.astype(np.float32) - zero_point) * scale
+        return output.copy()
+
+
+def load_tflite(path):
+    threads = os.getenv('TFLITE_NUM_THREADS')
+    return TFLiteModel(path, num_threads=int(threads) if threads else None)
+
+
+def load_samples(sample_dir, limit=200):
+    """Preprocess up to ``limit`` images from ``sample_dir`` exactly as the app does."""
+    paths = sorted(path for path in glob.glob(os.path.join(sample_dir, '**', '*'), recursive=True)
+                   if path.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    width, height = image_pipeline.MODEL_INPUT_SIZE
+    batch = np.empty((len(paths), height, width, 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            image_pipeline.load_into(f.read(), batch[i])
+    return batch
+
+
+def export(keras_path, out_path, quantization='float16', samples=None):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization != 'none':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if samples is None or not len(samples):
+            raise ValueError("int8 quantization needs --samples images for calibration.")
+
+        def representative_dataset():
+            for sample in samples:
+                yield [sample[None, ...]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    tflite_model = converter.convert()
+    tmp = out_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(tflite_model)
+    os.replace(tmp, out_path)
+    return len(tflite_model)
+
+
+def probe(backend, path, samples_path, repeat=20):
+    """Load one backend in a fresh process and time it (run via ``compare``)."""
+    from model_registry import current_rss_bytes, load_keras
+
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    model = load_keras(path) if backend == 'keras' else load_tflite(path)
+    load_seconds = time.perf_counter() - started
+
+    samples = np.load(samples_path)
+    model.predict(samples[:1], verbose=0)  # warm up
+    single = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        model.predict(samples[i % len(samples)][None, ...], verbose=0)
+        single.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    predictions = model.predict(samples, verbose=0)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        'backend': backend,
+        'load_seconds': load_seconds,
+        'rss_mb': current_rss_bytes() / (1024 * 1024),
+        'rss_delta_mb': (current_rss_bytes() - rss_before) / (1024 * 1024),
+        'single_p50_ms': float(np.median(single)) * 1000,
+        'batch_ms_per_image': batch_seconds / len(samples) * 1000,
+        'tensorflow_imported': 'tensorflow' in sys.modules,
+        'file_mb': os.path.getsize(path) / (1024 * 1024),
+        'predictions': np.asarray(predictions, dtype=np.float32).tolist(),
+    }
+
+
+def compare(keras_path, tflite_path, samples):
+    import tempfile
+
+    with tempfile.NamedTemporaryFile(suffix='.npy', delete=False) as f:
+        np.save(f, samples)
+        samples_path = f.name
+    try:
+        reports = {}
+        for backend, path in (('keras', keras_path), ('tflite', tflite_path)):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '_probe', backend, path, samples_path],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            reports[backend] = json.loads(output.strip().splitlines()[-1])
+    finally:
+        os.unlink(samples_path)
+
+    expected = np.asarray(reports['keras'].pop('predictions'))
+    actual = np.asarray(reports['tflite'].pop('predictions'))
+    reports['parity'] = {
+        'samples': len(samples),
+        'top1_agreement': float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean()),
+        'max_prob_diff': float(np.abs(expected - actual).max()),
+        'mean_prob_diff': float(np.abs(expected - actual).mean()),
+    }
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and check the TFLite disease model.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('export')
+    p.add_argument('--model', default=DEFAULT_KERAS_PATH)
+    p.add_argument('--out', default=DEFAULT_TFLITE_PATH)
+    p.add_argument('--quantization', choices=QUANTIZATIONS, default='float16')
+    p.add_argument('--samples', help="Directory of leaf images (required for int8 calibration).")
+    p.add_argument('--limit', type=int, default=200)
+
+    p = sub.add_parser('compare')
+    p.add_argument('--model', default=DEFAULT_KERAS_PATH)
+    p.add_argument('--tflite', default=DEFAULT_TFLITE_PATH)
+    p.add_argument('--samples', required=True, help="Directory of leaf images to compare on.")
+    p.add_argument('--limit', type=int, default=200)
+    p.add_argument('--min-agreement', type=float, default=0.98)
+
+    p = sub.add_parser('_probe')
+    p.add_argument('backend', choices=['keras', 'tflite'])
+    p.add_argument('path')
+    p.add_argument('samples_path')
+
+    args = parser.parse_args(argv)
+
+    if args.command == '_probe':
+        print(json.dumps(probe(args.backend, args.path, args.samples_path)))
+        return
+
+    samples = load_samples(args.samples, args.limit) if args.samples else None
+    if args.command == 'export':
+        size = export(args.model, args.out, args.quantization, samples)
+        print(f"Wrote {args.out} ({size / (1024 * 1024):.1f} MB, {args.quantization})")
+        return
+
+    if not len(samples):
+        raise SystemExit(f"No images found in {args.samples}")
+    reports = compare(args.model, args.tflite, samples)
+    print(json.dumps(reports, indent=2))
+    if reports['parity']['top1_agreement'] < args.min_agreement:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()